@@ -0,0 +1,77 @@
+import os
+import hashlib
+import tempfile
+import astpack
+
+def compiler_tag(): # changes whenever the modules that shape the tree do
+  digest = hashlib.sha256(f"astpack {astpack.FORMAT_VERSION}\n".encode())
+  directory = os.path.dirname(os.path.abspath(__file__))
+  for module in ["lexer.py", "astgen.py", "defs.py", "astpack.py"]:
+    with open(os.path.join(directory, module), "rb") as f:
+      digest.update(f.read())
+  return digest.hexdigest()
+
+class AstCache: # parsed trees keyed by the hash of their source text, least recently used entries are evicted first
+  def __init__(self, directory, max_size=64 * 1024 * 1024):
+    self.directory = directory
+    self.max_size = max_size # bytes on disk for all entries together
+    self.tag = compiler_tag()
+
+  def key(self, text):
+    digest = hashlib.sha256(self.tag.encode())
+    digest.update(text.encode("utf-8", "surrogatepass") if isinstance(text, str) else text)
+    return digest.hexdigest()
+
+  def path(self, key):
+    return os.path.join(self.directory, f"{key}.ast")
+
+  def load(self, key, source): # the cached declarations, None on a miss
+    path = self.path(key)
+    try:
+      with open(path, "rb") as f:
+        data = f.read()
+      os.utime(path) # the modification time is what eviction goes by
+    except OSError:
+      return None
+    try:
+      return astpack.loads(data, source)
+    except ValueError: # written by another format version, cut short or damaged
+      return None
+
+  def store(self, key, nodes): # best effort, an unwritable directory or a full disk only means the tree isn't cached
+    data = astpack.dumps(nodes)
+    temporary = None
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+      with tempfile.NamedTemporaryFile("wb", dir=self.directory, suffix=".tmp", delete=False) as f:
+        temporary = f.name
+        f.write(data)
+      os.replace(temporary, self.path(key)) # readers never see a partial entry
+      temporary = None
+      self.evict()
+    except OSError:
+      if temporary is not None: # eviction only counts entries, a leftover would stay forever
+        try:
+          os.unlink(temporary)
+        except OSError:
+          pass
+
+  def evict(self):
+    entries = []
+    for entry in os.scandir(self.directory):
+      if entry.name.endswith(".ast"):
+        try:
+          stat = entry.stat()
+        except OSError: # removed by a concurrent run
+          continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+      if total <= self.max_size:
+        break
+      try:
+        os.unlink(path)
+      except OSError:
+        pass
+      total -= size
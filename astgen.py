@@ -1,45 +1,184 @@
+import sys
 import traceback
-from defs import TokenType, Token, AstNodeType, IdentifierType, AstNode, Location, CompilerError, token_names, TypeInfo
+import dump
+import astpack
+import scopes
+from defs import TokenType, Token, AstNodeType, IdentifierType, AstNode, NameNode, LiteralNode, DeclarationNode, FunctionNode, Parameter, Location, SourceFile, TokenStore, CompilerError, token_names, TypeInfo
 from treelib import Node, Tree
-from functools import wraps
-
-def debug(num_tokens):
-  def decorator(func):
-    @wraps(func)
-    def wrapper(self, *args, **kwargs):
-      if False:
-        print(func.__name__)
-        print(self.peek())
-      return func(self, *args, **kwargs)
-    return wrapper
-  return decorator
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+rules = set() # names of the grammar rule methods, what a RuleProfiler instruments
+
+def rule(func): # the method itself is returned untouched, so unprofiled parsing pays nothing
+  rules.add(func.__name__)
+  return func
+
+PRECEDENCE_OR = 1; PRECEDENCE_AND = 2; PRECEDENCE_EQUALITY = 3
+PRECEDENCE_COMPARISON = 4; PRECEDENCE_TERM = 5; PRECEDENCE_FACTOR = 6
+
+binary_operators = { # token: (node type, precedence), "||" and "&&" build n-ary nodes
+  TokenType.TOKEN_OR: (AstNodeType.OR, PRECEDENCE_OR),
+  TokenType.TOKEN_AND: (AstNodeType.AND, PRECEDENCE_AND),
+  TokenType.TOKEN_EQUAL_EQUAL: (AstNodeType.EQUAL, PRECEDENCE_EQUALITY),
+  TokenType.TOKEN_NOT_EQUAL: (AstNodeType.NOT_EQUAL, PRECEDENCE_EQUALITY),
+  TokenType.TOKEN_GTS: (AstNodeType.GREATER_THAN, PRECEDENCE_COMPARISON),
+  TokenType.TOKEN_LTS: (AstNodeType.LESS_THAN, PRECEDENCE_COMPARISON),
+  TokenType.TOKEN_GTE: (AstNodeType.GREATER_EQUAL_THAN, PRECEDENCE_COMPARISON),
+  TokenType.TOKEN_LTE: (AstNodeType.LESS_EQUAL_THAN, PRECEDENCE_COMPARISON),
+  TokenType.TOKEN_PLUS: (AstNodeType.SUM, PRECEDENCE_TERM),
+  TokenType.TOKEN_DASH: (AstNodeType.SUBTRACT, PRECEDENCE_TERM),
+  TokenType.TOKEN_STAR: (AstNodeType.MULTIPLY, PRECEDENCE_FACTOR),
+  TokenType.TOKEN_SLASH: (AstNodeType.DIVIDE, PRECEDENCE_FACTOR),
+}
+
+unary_operators = {
+  TokenType.TOKEN_EXCL: AstNodeType.NEGATE,
+  TokenType.TOKEN_DASH: AstNodeType.MINUS,
+  TokenType.TOKEN_STAR: AstNodeType.POINTER,
+}
+
+literal_nodes = { # tokens that are a whole primary expression on their own
+  TokenType.TOKEN_NUMBER: AstNodeType.NUMBER_LITERAL,
+  TokenType.TOKEN_CHARLIT: AstNodeType.CHAR_LITERAL,
+  TokenType.TOKEN_STRLIT: AstNodeType.STRING_LITERAL,
+  TokenType.TOKEN_TRUE: AstNodeType.TRUE_LITERAL,
+  TokenType.TOKEN_FALSE: AstNodeType.FALSE_LITERAL,
+}
+
+# what an expression frame of the iterative parser is waiting for from its child frame
+RESUME_ASSIGN = 0; RESUME_PAREN = 1; RESUME_ARGUMENT = 2
+
+# states of the iterative expression parser
+EXPR_START = 0; EXPR_OPERAND = 1; EXPR_POSTFIX = 2; EXPR_ARGUMENTS = 3; EXPR_OPERATOR = 4; EXPR_END = 5
+
+class ExpressionFrame: # one parse_assignment in progress in the iterative parser
+  __slots__ = ("location", "assignable", "operands", "operators", "prefixes", "operand_location", "primary_location", "node", "resume")
+
+  def __init__(self, location, assignable):
+    self.location = location
+    self.assignable = assignable # only expressions not starting with a name can end with "= ..."
+    self.operands = [] # (node, location of its first token, precedence if it's an open "||"/"&&" chain)
+    self.operators = [] # (node type, precedence)
+    self.prefixes = [] # unary operators waiting for their operand
+    self.operand_location = None
+    self.primary_location = None
+    self.node = None # assignment or function call waiting for a child frame
+    self.resume = None
+
+# open statements of the iterative statement parser
+STMT_BLOCK = 0; STMT_IF = 1; STMT_BODY = 2; STMT_FUNCTION = 3
+
+class TokenStream: # pulls tokens lazily from an iterable, keeping only a window of them
+  def __init__(self, tokens, store=None):
+    self.source = iter(tokens)
+    self.store = store # TokenWindow the tokens are views of, it forgets the released ones too
+    self.window = deque()
+    self.base = 0 # absolute position of window[0]
+    self.last = None
+
+  def available(self, position):
+    while position - self.base >= len(self.window):
+      token = next(self.source, None)
+      if token is None:
+        return False
+      self.window.append(token)
+      self.last = token
+    return True
+
+  def __getitem__(self, position):
+    return self.window[position - self.base]
+
+  def release(self, position): # forget tokens before position, the parser won't go back there
+    window = self.window
+    while self.base < position and window:
+      window.popleft()
+      self.base += 1
+    if self.store is not None and self.last is not None:
+      self.store.discard(min(self.base, self.last.index)) # the last token stays, errors at the end of input point at it
+
+def declaration_ends(types): # token index after each top-level declaration, None if the braces don't balance
+  ends = []
+  depth = 0
+  for index, token_type in enumerate(types):
+    if token_type == TokenType.TOKEN_OCURLY:
+      depth += 1
+    elif token_type == TokenType.TOKEN_CCURLY:
+      depth -= 1
+      if depth == 0:
+        ends.append(index + 1)
+      elif depth < 0:
+        return None
+    elif token_type == TokenType.TOKEN_SEMICOL and depth == 0:
+      ends.append(index + 1)
+  if depth != 0:
+    return None
+  if not ends or ends[-1] != len(types): # trailing tokens, let the parser complain about them
+    ends.append(len(types))
+  return ends
+
+worker_state = {} # set once per pool process by init_worker
+
+def init_worker(file_path, store, iterative):
+  worker_state["file_path"] = file_path
+  worker_state["store"] = store
+  worker_state["iterative"] = iterative
+
+def parse_chunk(start, end): # the packed declarations in tokens [start, end), None on a syntax error
+  store = worker_state["store"]
+  parser = AstGen(worker_state["file_path"], map(store.__getitem__, range(start, end)), worker_state["iterative"])
+  declarations = []
+  try:
+    while not parser.eof():
+      declarations.append(parser.parse_declaration())
+  except CompilerError:
+    return None
+  return astpack.pack(declarations)
 
 class AstGen:
   cursor = 0
 
-  def __init__(self, file_path, tokens):
+  def __init__(self, file_path, tokens, iterative=False, profiler=None):
     self.file_path = file_path
-    self.tokens = tokens
+    self.store = tokens if isinstance(tokens, TokenStore) else None # only a whole token store can be split for parse_parallel
+    self.iterative = iterative
+    self.tokens = tokens if isinstance(tokens, TokenStream) else TokenStream(tokens)
     self.program = None
+    self.error = None # the CompilerError that stopped parse, the program is incomplete then
+    self.start_location = Location(SourceFile(file_path, ""), 0)
+    self.symbols = scopes.SymbolTable() # locals of the function being parsed, top-level declarations can be split between processes
+    self.body_scope = False # the next block is a function's body, declaring in the scope of its parameters
+    if profiler is not None: # wrap the rules of this instance only
+      profiler.instrument(self, sorted(rules))
+    if iterative: # explicit stacks instead of recursion, nesting depth is only limited by memory
+      self.parse_expression = self.parse_expression_iterative
+      self.parse_statement = lambda: self.parse_statement_iterative(False)
+      self.parse_declaration = lambda: self.parse_statement_iterative(True)
 
   def eof(self):
-    return self.cursor >= len(self.tokens)
+    return not self.tokens.available(self.cursor)
 
   def incr(self, offset=1):
     self.cursor += offset
 
   def peek(self, offset=0):
     position = self.cursor + offset
-    if position >= len(self.tokens):
+    if not self.tokens.available(position):
       raise CompilerError(self, "eof")
     return self.tokens[position]
   
   def get_current_location(self, offset=0):
     position = self.cursor + offset
-    if position >= len(self.tokens):
-      raise CompilerError(self, "eof")
+    if not self.tokens.available(position):
+      if self.tokens.last is None:
+        return self.start_location
+      return self.tokens.last.location
     return self.tokens[position].location
   
+  def lookahead(self, token_type, offset=0): # like peek, but false at eof instead of raising
+    position = self.cursor + offset
+    return self.tokens.available(position) and self.tokens[position].type == token_type
+
   def expect_token(self, token_type, incr=True):
     token = self.peek()
     if token.type != token_type:
@@ -48,15 +187,15 @@ class AstGen:
       self.incr()
     return token
   
-  @debug(0)
+  @rule
   def parse_identifier(self):
     t0 = self.peek()
     if t0.type != TokenType.TOKEN_NAME:
       raise CompilerError(self, "expected identifier")
     self.incr()
-    return t0.text
+    return t0
   
-  @debug(0)
+  @rule
   def parse_type(self):
     t0 = self.peek(0)
     t1 = self.peek(1)
@@ -83,7 +222,7 @@ class AstGen:
         case _:
           raise CompilerError(self, "expected type")
 
-  @debug(0)     
+  @rule
   def parse_primary(self):
     location = self.peek().location
     match self.peek().type:
@@ -92,35 +231,36 @@ class AstGen:
           AstNodeType.VALUE,
           location,
         )
-        identifier_node = AstNode(
+        identifier_node = NameNode(
           AstNodeType.IDENTIFIER,
           location,
-          {"name": self.peek().text},
+          self.peek().text,
+          self.peek().id,
         )
         value_node.append(identifier_node)
         self.incr()
         return value_node
       case TokenType.TOKEN_NUMBER:
-        number_node = AstNode(
+        number_node = LiteralNode(
           AstNodeType.NUMBER_LITERAL,
           location,
-          {"value": self.peek().text},
+          self.peek().text,
         )
         self.incr()
         return number_node
       case TokenType.TOKEN_CHARLIT:
-        charlit_node = AstNode(
+        charlit_node = LiteralNode(
           AstNodeType.CHAR_LITERAL,
           location,
-          {"value": self.peek().text},
+          self.peek().text,
         )
         self.incr()
         return charlit_node
       case TokenType.TOKEN_STRLIT:
-        strlit_node = AstNode(
+        strlit_node = LiteralNode(
           AstNodeType.STRING_LITERAL,
           location,
-          {"value": self.peek().text},
+          self.peek().text,
         )
         self.incr()
         return strlit_node
@@ -150,7 +290,7 @@ class AstGen:
         raise CompilerError(self, "invalid token for primary expression")
       
   """
-  @debug(0)      
+  @rule
   def parse_call(self):
     location = self.peek().location
     cursor = self.cursor
@@ -188,52 +328,52 @@ class AstGen:
       return self.parse_primary()
   """
 
-  @debug(0)      
+  @rule
   def parse_call(self):
     location = self.peek().location
-    cursor = self.cursor
     if self.peek().type == TokenType.TOKEN_NAME:
-      node = AstNode(
+      if not self.lookahead(TokenType.TOKEN_OPAREN, 1):
+        return self.parse_primary()
+      node = NameNode(
         AstNodeType.IDENTIFIER,
         location,
-        {"name": self.peek().text},
+        self.peek().text,
+        self.peek().id,
       )
       self.incr()
     else:
       node = self.parse_primary()
-    if not self.eof() and self.peek().type == TokenType.TOKEN_OPAREN:
-      self.incr()
-      function_call_node = AstNode(
-        AstNodeType.FUNCTION_CALL,
-        location,
-      )
-      function_call_callee_node = AstNode(
-        AstNodeType.FUNCTION_CALL_CALLEE,
-        location,
-      )
-      function_call_arguments_node = AstNode(
-        AstNodeType.FUNCTION_CALL_ARGS,
-        location,
-      )
-      while not self.eof() and self.peek().type != TokenType.TOKEN_CPAREN:
-        function_call_arguments_node.append(self.parse_expression())
-        match self.peek().type:
-          case TokenType.TOKEN_COMMA:
-            self.incr()
-          case TokenType.TOKEN_CPAREN:
-            break
-          case _:
-            raise CompilerError(self, "expected \",\" or \")\"")
-      self.incr()
-      function_call_callee_node.append(node)
-      function_call_node.append(function_call_callee_node)
-      function_call_node.append(function_call_arguments_node)
-      return function_call_node
-    else:
-      self.cursor = cursor
-      return self.parse_primary()
+      if not self.lookahead(TokenType.TOKEN_OPAREN):
+        return node
+    self.incr()
+    function_call_node = AstNode(
+      AstNodeType.FUNCTION_CALL,
+      location,
+    )
+    function_call_callee_node = AstNode(
+      AstNodeType.FUNCTION_CALL_CALLEE,
+      location,
+    )
+    function_call_arguments_node = AstNode(
+      AstNodeType.FUNCTION_CALL_ARGS,
+      location,
+    )
+    while not self.eof() and self.peek().type != TokenType.TOKEN_CPAREN:
+      function_call_arguments_node.append(self.parse_expression())
+      match self.peek().type:
+        case TokenType.TOKEN_COMMA:
+          self.incr()
+        case TokenType.TOKEN_CPAREN:
+          break
+        case _:
+          raise CompilerError(self, "expected \",\" or \")\"")
+    self.incr()
+    function_call_callee_node.append(node)
+    function_call_node.append(function_call_callee_node)
+    function_call_node.append(function_call_arguments_node)
+    return function_call_node
 
-  @debug(0)      
+  @rule
   def parse_unary(self):
     location = self.peek().location
     match self.peek().type:
@@ -247,10 +387,11 @@ class AstGen:
         self.incr()
         unary_type = AstNodeType.POINTER
         if self.peek().type == TokenType.TOKEN_NAME:
-          identifier = AstNode(
+          identifier = NameNode(
             AstNodeType.IDENTIFIER,
             location,
-            {"name": self.peek().text},
+            self.peek().text,
+            self.peek().id,
           )
           self.incr()
           unary_node = AstNode(
@@ -268,125 +409,52 @@ class AstGen:
     unary_node.append(self.parse_unary())
     return unary_node
 
-  @debug(0)      
-  def parse_factor(self):
+  @rule
+  def parse_binary(self, min_precedence=PRECEDENCE_OR): # precedence climbing over binary_operators
     location = self.peek().location
-    factor_node = None
-    unary_node = self.parse_unary()
-    while not self.eof() and self.peek().type in [TokenType.TOKEN_STAR, TokenType.TOKEN_SLASH]:
-      factor_node = AstNode(
-        AstNodeType.MULTIPLY if self.peek().type == TokenType.TOKEN_STAR else AstNodeType.DIVIDE,
-        location,
-      )
-      self.incr()
-      factor_node.append(unary_node)
-      factor_node.append(self.parse_unary())
-      unary_node = factor_node
-    return unary_node
-
-  @debug(0)      
-  def parse_term(self):
-    location = self.peek().location
-    term_node = None
-    factor_node = self.parse_factor()
-    while not self.eof() and self.peek().type in [TokenType.TOKEN_PLUS, TokenType.TOKEN_DASH]:
-      term_node = AstNode(
-        AstNodeType.SUM if self.peek().type == TokenType.TOKEN_PLUS else AstNodeType.SUBTRACT,
-        location,
-      )
-      self.incr()
-      term_node.append(factor_node)
-      term_node.append(self.parse_factor())
-      factor_node = term_node
-    return factor_node
-
-  @debug(0)    
-  def parse_comparison(self):
-    location = self.peek().location
-    comparison_node = None
-    term_node = self.parse_term()
+    left = self.parse_unary()
+    chain = None # n-ary "||"/"&&" node being extended by this loop
     while not self.eof():
-      match self.peek().type:
-        case TokenType.TOKEN_GTS:
-          comparison_type = AstNodeType.GREATER_THAN
-        case TokenType.TOKEN_LTS:
-          comparison_type = AstNodeType.LESS_THAN
-        case TokenType.TOKEN_GTE:
-          comparison_type = AstNodeType.GREATER_EQUAL_THAN
-        case TokenType.TOKEN_LTE:
-          comparison_type = AstNodeType.LESS_EQUAL_THAN
-        case _:
-          return term_node
-      comparison_node = AstNode(
-        comparison_type,
-        location,
-      )
-      self.incr()
-      comparison_node.append(term_node)
-      comparison_node.append(self.parse_term())
-      term_node = comparison_node
-    return term_node
-  
-  @debug(0)      
-  def parse_equality(self):
-    location = self.peek().location
-    equality_node = None
-    comparison_node = self.parse_comparison()
-    while not self.eof() and self.peek().type in [TokenType.TOKEN_EQUAL_EQUAL, TokenType.TOKEN_NOT_EQUAL]:
-      equality_node = AstNode(
-        AstNodeType.EQUAL if self.peek().type == TokenType.TOKEN_EQUAL_EQUAL else AstNodeType.NOT_EQUAL,
-        location,
-      )
+      operator = binary_operators.get(self.peek().type)
+      if operator is None or operator[1] < min_precedence:
+        break
+      node_type, precedence = operator
       self.incr()
-      equality_node.append(comparison_node)
-      equality_node.append(self.parse_comparison())
-      comparison_node = equality_node
-    return comparison_node
-
-  @debug(0)     
-  def parse_and(self):
-    location = self.peek().location
-    equality_node = self.parse_equality()
-    if self.peek().type == TokenType.TOKEN_AND:
-      and_node = AstNode(
-        AstNodeType.OR,
-        location,
-      )
-      and_node.append(equality_node)
-      while not self.eof() and self.peek().type == TokenType.TOKEN_AND:
-        self.incr()
-        and_node.append(self.parse_equality())
-      return and_node
-    return equality_node
+      right = self.parse_binary(precedence + 1)
+      if precedence <= PRECEDENCE_AND:
+        if chain is None or chain_precedence != precedence:
+          chain = AstNode(
+            node_type,
+            location,
+          )
+          chain.append(left)
+          chain_precedence = precedence
+          left = chain
+        chain.append(right)
+      else:
+        binary_node = AstNode(
+          node_type,
+          location,
+        )
+        binary_node.append(left)
+        binary_node.append(right)
+        left = binary_node
+    return left
 
-  @debug(0)      
-  def parse_or(self):
-    location = self.peek().location
-    and_node = self.parse_and()
-    if self.peek().type == TokenType.TOKEN_OR:
-      or_node = AstNode(
-        AstNodeType.OR,
-        location,
-      )
-      or_node.append(and_node)
-      while not self.eof() and self.peek().type == TokenType.TOKEN_OR:
-        self.incr()
-        or_node.append(self.parse_and())
-      return or_node
-    return and_node
 
   """
-  @debug(0)   
+  @rule
   def parse_assignment(self):
     location = self.peek().location
     t0 = self.peek(0)
     t1 = self.peek(1)
     if t0.type == TokenType.TOKEN_NAME and t1.type == TokenType.TOKEN_EQUAL:
       self.incr(2)
-      assignment = AstNode(
+      assignment = NameNode(
         AstNodeType.ASSIGNMENT,
         location,
-        {"name": t0.text},
+        t0.text,
+        t0.id,
       )
       assignment.append(self.parse_assignment())
       return assignment
@@ -394,38 +462,238 @@ class AstGen:
       return self.parse_or()
   """
 
-  
-  @debug(0)   
-  def parse_assignment(self):
+
+  @rule
+  def parse_assignment(self): # the left side is parsed once, then "=" decides what it was
     location = self.peek().location
-    cursor = self.cursor
     if self.peek().type == TokenType.TOKEN_NAME:
-      lvalue = AstNode(
+      if self.peek(1).type != TokenType.TOKEN_EQUAL:
+        return self.parse_binary()
+      lvalue = NameNode(
         AstNodeType.IDENTIFIER,
         location,
-        {"name": self.peek().text},
+        self.peek().text,
+        self.peek().id,
       )
       self.incr()
     else:
-      lvalue = self.parse_or()
-    if self.peek().type == TokenType.TOKEN_EQUAL:
-      self.incr()
-      assignment = AstNode(
-        AstNodeType.ASSIGNMENT,
-        location,
-      )
-      assignment.append(lvalue)
-      assignment.append(self.parse_expression())
-      return assignment
-    else:
-      self.cursor = cursor
-      return self.parse_or()
+      lvalue = self.parse_binary()
+      if self.peek().type != TokenType.TOKEN_EQUAL:
+        return lvalue
+    self.incr()
+    assignment = AstNode(
+      AstNodeType.ASSIGNMENT,
+      location,
+    )
+    assignment.append(lvalue)
+    assignment.append(self.parse_expression())
+    return assignment
 
-  @debug(0)    
+  @rule
   def parse_expression(self):
     return self.parse_assignment()
 
-  @debug(0)  
+  @rule
+  def parse_expression_iterative(self): # same trees as parse_assignment, with one frame per nested expression
+    frames = []
+    state = EXPR_START
+    while True:
+      if state == EXPR_START:
+        location = self.peek().location
+        if self.peek().type == TokenType.TOKEN_NAME:
+          if self.peek(1).type == TokenType.TOKEN_EQUAL:
+            lvalue = NameNode(
+              AstNodeType.IDENTIFIER,
+              location,
+              self.peek().text,
+              self.peek().id,
+            )
+            self.incr(2)
+            frame = ExpressionFrame(location, False)
+            frame.node = AstNode(
+              AstNodeType.ASSIGNMENT,
+              location,
+            )
+            frame.node.append(lvalue)
+            frame.resume = RESUME_ASSIGN
+            frames.append(frame)
+            continue
+          frame = ExpressionFrame(location, False)
+        else:
+          frame = ExpressionFrame(location, True)
+        state = EXPR_OPERAND
+      elif state == EXPR_OPERAND: # unary operators, then a primary
+        token = self.peek()
+        frame.operand_location = token.location
+        while token.type in unary_operators:
+          self.incr()
+          if token.type == TokenType.TOKEN_STAR and self.peek().type == TokenType.TOKEN_NAME:
+            break
+          frame.prefixes.append((unary_operators[token.type], token.location))
+          token = self.peek()
+        if token.type == TokenType.TOKEN_STAR: # "*name" is a complete operand
+          node = AstNode(
+            AstNodeType.POINTER,
+            token.location,
+          )
+          node.append(NameNode(
+            AstNodeType.IDENTIFIER,
+            token.location,
+            self.peek().text,
+            self.peek().id,
+          ))
+          self.incr()
+          state = EXPR_OPERATOR
+          continue
+        location = token.location
+        frame.primary_location = location
+        if token.type == TokenType.TOKEN_NAME:
+          identifier_node = NameNode(
+            AstNodeType.IDENTIFIER,
+            location,
+            token.text,
+            token.id,
+          )
+          self.incr()
+          if self.lookahead(TokenType.TOKEN_OPAREN):
+            node = identifier_node
+            state = EXPR_POSTFIX
+          else:
+            node = AstNode(
+              AstNodeType.VALUE,
+              location,
+            )
+            node.append(identifier_node)
+            state = EXPR_OPERATOR
+        elif token.type in literal_nodes:
+          node_type = literal_nodes[token.type]
+          if node_type in (AstNodeType.TRUE_LITERAL, AstNodeType.FALSE_LITERAL):
+            node = AstNode(node_type, location)
+          else:
+            node = LiteralNode(node_type, location, token.text)
+          self.incr()
+          state = EXPR_POSTFIX
+        elif token.type == TokenType.TOKEN_OPAREN:
+          self.incr()
+          frame.resume = RESUME_PAREN
+          frames.append(frame)
+          state = EXPR_START
+        else:
+          raise CompilerError(self, "invalid token for primary expression")
+      elif state == EXPR_POSTFIX: # a primary, possibly called
+        if not self.lookahead(TokenType.TOKEN_OPAREN):
+          state = EXPR_OPERATOR
+          continue
+        self.incr()
+        location = frame.primary_location
+        function_call_node = AstNode(
+          AstNodeType.FUNCTION_CALL,
+          location,
+        )
+        function_call_callee_node = AstNode(
+          AstNodeType.FUNCTION_CALL_CALLEE,
+          location,
+        )
+        function_call_callee_node.append(node)
+        function_call_node.append(function_call_callee_node)
+        function_call_node.append(AstNode(
+          AstNodeType.FUNCTION_CALL_ARGS,
+          location,
+        ))
+        frame.node = function_call_node
+        state = EXPR_ARGUMENTS
+      elif state == EXPR_ARGUMENTS: # before an argument or the closing parenthesis
+        if not self.eof() and self.peek().type != TokenType.TOKEN_CPAREN:
+          frame.resume = RESUME_ARGUMENT
+          frames.append(frame)
+          state = EXPR_START
+          continue
+        self.incr()
+        node = frame.node
+        frame.node = None
+        state = EXPR_OPERATOR
+      elif state == EXPR_OPERATOR: # node is a complete primary, apply the unary operators and look for a binary one
+        prefixes = frame.prefixes
+        while prefixes:
+          unary_type, location = prefixes.pop()
+          unary_node = AstNode(
+            unary_type,
+            location,
+          )
+          unary_node.append(node)
+          node = unary_node
+        operands = frame.operands
+        operands.append((node, frame.operand_location, None))
+        operator = None if self.eof() else binary_operators.get(self.peek().type)
+        if operator is None:
+          state = EXPR_END
+          continue
+        while frame.operators and frame.operators[-1][1] >= operator[1]:
+          self.reduce_binary(frame)
+        frame.operators.append(operator)
+        self.incr()
+        state = EXPR_OPERAND
+      elif state == EXPR_END: # reduce what's left and hand the result to the parent frame
+        while frame.operators:
+          self.reduce_binary(frame)
+        node = frame.operands[0][0]
+        if frame.assignable and self.peek().type == TokenType.TOKEN_EQUAL:
+          self.incr()
+          frame.node = AstNode(
+            AstNodeType.ASSIGNMENT,
+            frame.location,
+          )
+          frame.node.append(node)
+          frame.resume = RESUME_ASSIGN
+          frames.append(frame)
+          state = EXPR_START
+          continue
+        while True:
+          if not frames:
+            return node
+          frame = frames.pop()
+          if frame.resume == RESUME_ASSIGN: # the parent is complete as well
+            frame.node.append(node)
+            node = frame.node
+            continue
+          if frame.resume == RESUME_PAREN:
+            if self.peek().type != TokenType.TOKEN_CPAREN:
+              raise CompilerError(self, "\")\" expected")
+            self.incr()
+            state = EXPR_POSTFIX
+          else:
+            frame.node.children[1].append(node)
+            match self.peek().type:
+              case TokenType.TOKEN_COMMA:
+                self.incr()
+              case TokenType.TOKEN_CPAREN:
+                pass
+              case _:
+                raise CompilerError(self, "expected \",\" or \")\"")
+            state = EXPR_ARGUMENTS
+          break
+
+  def reduce_binary(self, frame): # pop one operator of an expression frame with its two operands
+    node_type, precedence = frame.operators.pop()
+    operands = frame.operands
+    right = operands.pop()[0]
+    left, location, chain_precedence = operands[-1]
+    if precedence <= PRECEDENCE_AND:
+      if chain_precedence == precedence:
+        left.append(right)
+        return
+      chain_precedence = precedence
+    else:
+      chain_precedence = None
+    binary_node = AstNode(
+      node_type,
+      location,
+    )
+    binary_node.append(left)
+    binary_node.append(right)
+    operands[-1] = (binary_node, location, chain_precedence)
+
+  @rule
   def parse_parameters(self):
     parameters = []
     self.expect_token(TokenType.TOKEN_OPAREN)
@@ -437,15 +705,15 @@ class AstGen:
         raise CompilerError(self, "use pointers to pass arrays into function")
       if identifier_type.type == IdentifierType.VOID:
         raise CompilerError(self, "can't use a \"void\" parameter in function")
-      identifier_name = self.parse_identifier()
-      parameters.append({"name": identifier_name, "type": identifier_type})
+      identifier = self.parse_identifier()
+      parameters.append(self.declared(identifier, Parameter(identifier.text, identifier.id, identifier_type)))
       match self.peek().type:
         case TokenType.TOKEN_COMMA:
           self.incr()
     self.incr()
     return parameters
   
-  @debug(0)
+  @rule
   def parse_arguments(self):
     location = self.peek().location
     arguments = AstNode(
@@ -464,20 +732,26 @@ class AstGen:
     self.incr()
     return arguments
   
-  @debug(0)
+  @rule
   def parse_exprstmt(self):
     expression_node = self.parse_expression()
     self.expect_token(TokenType.TOKEN_SEMICOL)
     return expression_node
   
-  @debug(0)
+  @rule
   def parse_block(self):
     location = self.peek().location
     statements = []
+    scoped = not self.body_scope
+    self.body_scope = False
+    if scoped:
+      self.symbols.enter()
     self.expect_token(TokenType.TOKEN_OCURLY)
     while not self.eof() and self.peek().type != TokenType.TOKEN_CCURLY:
       statements.append(self.parse_declaration())
     self.expect_token(TokenType.TOKEN_CCURLY)
+    if scoped:
+      self.symbols.exit()
     block_node = AstNode(
       AstNodeType.BLOCK,
       location,
@@ -485,8 +759,17 @@ class AstGen:
     block_node.extend(statements)
     return block_node
   
-  @debug(0)
+  @rule
   def parse_if(self):
+    if_node, if_body_node = self.parse_if_head()
+    if_body_node.append(self.parse_statement())
+    else_body_node = self.parse_else_head(if_node)
+    if else_body_node is not None:
+      else_body_node.append(self.parse_statement())
+    return if_node
+
+  @rule
+  def parse_if_head(self): # everything up to the body, which goes in the returned IF_BODY node
     location = self.peek().location
     self.expect_token(TokenType.TOKEN_IF)
     self.expect_token(TokenType.TOKEN_OPAREN)
@@ -504,21 +787,30 @@ class AstGen:
       AstNodeType.IF_BODY,
       self.peek().location,
     )
-    if_body_node.append(self.parse_statement())
     if_node.append(if_condition_node)
     if_node.append(if_body_node)
+    return if_node, if_body_node
+
+  @rule
+  def parse_else_head(self, if_node): # the ELSE_BODY node to fill, None if there's no "else"
     if self.peek().type == TokenType.TOKEN_ELSE:
       self.incr()
       else_body_node = AstNode(
         AstNodeType.ELSE_BODY,
         self.peek().location,
       )
-      else_body_node.append(self.parse_statement())
       if_node.append(else_body_node)
-    return if_node
+      return else_body_node
+    return None
   
-  @debug(0)
+  @rule
   def parse_while(self):
+    while_node, while_body_node = self.parse_while_head()
+    while_body_node.append(self.parse_statement())
+    return while_node
+
+  @rule
+  def parse_while_head(self):
     location = self.peek().location
     self.expect_token(TokenType.TOKEN_WHILE)
     self.expect_token(TokenType.TOKEN_OPAREN)
@@ -536,13 +828,18 @@ class AstGen:
       AstNodeType.WHILE_BODY,
       self.peek().location,
     )
-    while_body_node.append(self.parse_statement())
     while_node.append(while_condition_node)
     while_node.append(while_body_node)
-    return while_node
+    return while_node, while_body_node
   
-  @debug(0)
+  @rule
   def parse_for(self):
+    for_node, for_body_node = self.parse_for_head()
+    for_body_node.append(self.parse_statement())
+    return for_node
+
+  @rule
+  def parse_for_head(self):
     location = self.peek().location
     self.expect_token(TokenType.TOKEN_FOR)
     self.expect_token(TokenType.TOKEN_OPAREN)
@@ -581,14 +878,13 @@ class AstGen:
       AstNodeType.FOR_BODY,
       self.peek().location,
     )
-    for_body_node.append(self.parse_statement())
     for_node.append(for_init_node)
     for_node.append(for_condition_node)
     for_node.append(for_step_node)
     for_node.append(for_body_node)
-    return for_node
+    return for_node, for_body_node
 
-  @debug(0)
+  @rule
   def parse_return(self):
     location = self.peek().location
     self.expect_token(TokenType.TOKEN_RETURN)
@@ -603,8 +899,9 @@ class AstGen:
     self.incr()
     return return_node
     
-  @debug(0)
+  @rule
   def parse_statement(self):
+    self.tokens.release(self.cursor)
     match self.peek().type:
       case TokenType.TOKEN_OCURLY:
         return self.parse_block()
@@ -619,12 +916,29 @@ class AstGen:
       case _:
         return self.parse_exprstmt()
   
-  @debug(0)
+  @rule
   def parse_declaration(self):
+    declaration = self.parse_declaration_head()
+    if declaration is None:
+      return self.parse_statement()
+    if declaration.type == AstNodeType.FUNCTION_DECLARATION:
+      self.body_scope = self.peek().type == TokenType.TOKEN_OCURLY
+      declaration.append(self.parse_statement())
+      self.symbols.exit()
+    return declaration
+
+  def declared(self, identifier, declaration): # declaration, unless it's of a local already declared in the same scope
+    if self.symbols.depth and self.symbols.declare(identifier.id, declaration) is not None:
+      raise CompilerError(self, f"redeclaration of \"{identifier.text}\"")
+    return declaration
+
+  @rule
+  def parse_declaration_head(self): # a declaration without the function body, None if it's a statement
+    self.tokens.release(self.cursor)
     location = self.peek().location
     if self.peek().is_type():
       identifier_type = self.parse_type()
-      identifier_name = self.parse_identifier()
+      identifier = self.parse_identifier()
       match self.peek().type:
         case TokenType.TOKEN_OBRACK:
           self.incr()
@@ -646,22 +960,26 @@ class AstGen:
               raise CompilerError(self, "can't declare array of \"void\"")
             case _:
               raise CompilerError(self, "expected type")
-          return AstNode(
+          return self.declared(identifier, DeclarationNode(
             AstNodeType.VARIABLE_DECLARATION,
             location,
-            {"name": identifier_name, "type": identifier_type},
-          )    
+            identifier.text,
+            identifier.id,
+            identifier_type,
+          ))    
         case TokenType.TOKEN_EQUAL:
           self.incr()
           if identifier_type.type in [IdentifierType.CHAR_ARR, IdentifierType.INT_ARR]:
             raise CompilerError(self, "can't declare and assign to array variables (please assign values later with memory accesses)")
           if identifier_type.type == IdentifierType.VOID:
             raise CompilerError(self, "can't declare \"void\" variable")
-          variable_declaration = AstNode(
+          variable_declaration = self.declared(identifier, DeclarationNode(
             AstNodeType.VARIABLE_DECLARATION,
             location,
-            {"name": identifier_name, "type": identifier_type},
-          )
+            identifier.text,
+            identifier.id,
+            identifier_type,
+          ))
           variable_declaration.append(self.parse_expression())
           self.expect_token(TokenType.TOKEN_SEMICOL)
           return variable_declaration
@@ -669,39 +987,132 @@ class AstGen:
           self.incr()
           if identifier_type.type == IdentifierType.VOID:
             raise CompilerError(self, "can't declare \"void\" variable")
-          return AstNode(
+          return self.declared(identifier, DeclarationNode(
             AstNodeType.VARIABLE_DECLARATION,
             location,
-            {"name": identifier_name, "type": identifier_type},
-          )
+            identifier.text,
+            identifier.id,
+            identifier_type,
+          ))
         case TokenType.TOKEN_OPAREN:
           if identifier_type.type in [IdentifierType.CHAR_ARR, IdentifierType.INT_ARR]:
             raise CompilerError(self, "can't use array type as return value in function declaration (please use a pointer as return value)")
+          self.symbols.enter() # the scope of the parameters, left once the body is parsed
           parameters = self.parse_parameters()
-          function_decl_body = self.parse_statement()
-          function_decl = AstNode(
+          return FunctionNode(
             AstNodeType.FUNCTION_DECLARATION,
             location,
-            {"name": identifier_name, "type": identifier_type, "parameters": parameters},
+            identifier.text,
+            identifier.id,
+            identifier_type,
+            parameters,
           )
-          function_decl.append(function_decl_body)
-          return function_decl
         case _:
           raise CompilerError(self, "uhm weird")
     else:
-      return self.parse_statement()
+      return None
     
+  @rule
+  def parse_statement_iterative(self, declaration): # parse_statement (or parse_declaration) with a stack of open statements
+    stack = [] # (kind, node, node receiving the next statement)
+    while True:
+      node = self.parse_declaration_head() if declaration else None
+      if node is not None and node.type == AstNodeType.FUNCTION_DECLARATION:
+        stack.append((STMT_FUNCTION, node, node))
+        declaration = False
+        continue
+      if node is None:
+        self.tokens.release(self.cursor)
+        match self.peek().type:
+          case TokenType.TOKEN_OCURLY:
+            node = AstNode(
+              AstNodeType.BLOCK,
+              self.peek().location,
+            )
+            self.incr()
+            if not self.eof() and self.peek().type != TokenType.TOKEN_CCURLY:
+              if not stack or stack[-1][0] != STMT_FUNCTION: # a function's body declares in the scope of its parameters
+                self.symbols.enter()
+              stack.append((STMT_BLOCK, node, node))
+              declaration = True
+              continue
+            self.expect_token(TokenType.TOKEN_CCURLY)
+          case TokenType.TOKEN_IF:
+            if_node, if_body_node = self.parse_if_head()
+            stack.append((STMT_IF, if_node, if_body_node))
+            declaration = False
+            continue
+          case TokenType.TOKEN_WHILE:
+            stack.append((STMT_BODY, *self.parse_while_head()))
+            declaration = False
+            continue
+          case TokenType.TOKEN_FOR:
+            stack.append((STMT_BODY, *self.parse_for_head()))
+            declaration = False
+            continue
+          case TokenType.TOKEN_RETURN:
+            node = self.parse_return()
+          case _:
+            node = self.parse_exprstmt()
+      while True: # node is complete, close every statement that it completes
+        if not stack:
+          return node
+        kind, parent, body = stack[-1]
+        body.append(node)
+        if kind == STMT_BLOCK:
+          if not self.eof() and self.peek().type != TokenType.TOKEN_CCURLY:
+            declaration = True
+            break
+          self.expect_token(TokenType.TOKEN_CCURLY)
+          if len(stack) < 2 or stack[-2][0] != STMT_FUNCTION:
+            self.symbols.exit()
+        elif kind == STMT_IF:
+          else_body_node = self.parse_else_head(parent)
+          if else_body_node is not None:
+            stack[-1] = (STMT_BODY, parent, else_body_node)
+            declaration = False
+            break
+        elif kind == STMT_FUNCTION:
+          self.symbols.exit()
+        stack.pop()
+        node = parent
+
   def parse(self):
+    self.set_program([])
+    for declaration in self.declarations():
+      self.program.append(declaration)
+
+  def declarations(self): # yields each top-level declaration as soon as it's parsed
     try:
-      self.program = AstNode(
-        AstNodeType.PROGRAM,
-        Location(self.file_path, 0, 0),
-      )
       while not self.eof():
-        self.program.append(self.parse_declaration())
+        self.tokens.release(self.cursor)
+        yield self.parse_declaration()
     except CompilerError as compiler_error:
+      self.error = compiler_error
       traceback.print_exc()
       print(str(compiler_error))
 
-  def print(self):
-    self.program.print()
\ No newline at end of file
+  def parse_parallel(self, jobs, chunks_per_job=4): # same tree as parse, top-level declarations are parsed in a process pool
+    ends = declaration_ends(self.store.types) if self.store is not None and jobs > 1 else None
+    if not ends:
+      return self.parse()
+    num_chunks = min(len(ends), jobs * chunks_per_job)
+    chunk_ends = [ends[(len(ends) * (idx + 1)) // num_chunks - 1] for idx in range(num_chunks)]
+    chunk_starts = [0] + chunk_ends[:-1]
+    with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(self.file_path, self.store, self.iterative)) as pool:
+      results = list(pool.map(parse_chunk, chunk_starts, chunk_ends))
+    if None in results: # the serial parser reports the error
+      return self.parse()
+    self.set_program([])
+    for result in results:
+      self.program.extend(astpack.unpack(result, self.store.source))
+
+  def set_program(self, declarations): # a new program node holding declarations, which may come from elsewhere, like the cache
+    self.program = AstNode(
+      AstNodeType.PROGRAM,
+      self.start_location,
+    )
+    self.program.extend(declarations)
+
+  def print(self): # iterative, deep trees print fine
+    dump.AstWriter(sys.stdout).write(self.program)
\ No newline at end of file
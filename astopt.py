@@ -0,0 +1,177 @@
+from defs import AstNodeType, AstNode, LiteralNode
+
+# constant folding and algebraic simplification of the syntax tree, before codegen
+# ints are 2 bytes, so folded values wrap like the machine's arithmetic does
+
+word_mask = 0xFFFF
+signed_max = 0x7FFF # comparisons are only folded when signed and unsigned agree
+
+arithmetic = {
+  AstNodeType.SUM: lambda a, b: a + b,
+  AstNodeType.SUBTRACT: lambda a, b: a - b,
+  AstNodeType.MULTIPLY: lambda a, b: a * b,
+}
+comparisons = {
+  AstNodeType.EQUAL: lambda a, b: a == b,
+  AstNodeType.NOT_EQUAL: lambda a, b: a != b,
+  AstNodeType.LESS_THAN: lambda a, b: a < b,
+  AstNodeType.LESS_EQUAL_THAN: lambda a, b: a <= b,
+  AstNodeType.GREATER_THAN: lambda a, b: a > b,
+  AstNodeType.GREATER_EQUAL_THAN: lambda a, b: a >= b,
+}
+associative = (AstNodeType.SUM, AstNodeType.MULTIPLY) # (x + 1) + 2 is x + 3
+side_effects = (AstNodeType.FUNCTION_CALL, AstNodeType.ASSIGNMENT, AstNodeType.POINTER_ASSIGNMENT)
+
+# what fold_node does with each node type, in lists indexed by the type since hashing enum members is slow
+FOLD_NONE = 0; FOLD_LITERAL = 1; FOLD_UNARY = 2; FOLD_BINARY = 3; FOLD_IF = 4; FOLD_CHAIN = 5
+fold_kinds = [FOLD_NONE] * len(AstNodeType)
+for node_type in (AstNodeType.TRUE_LITERAL, AstNodeType.FALSE_LITERAL):
+  fold_kinds[node_type] = FOLD_LITERAL
+for node_type in (AstNodeType.MINUS, AstNodeType.NEGATE):
+  fold_kinds[node_type] = FOLD_UNARY
+for node_type in [*arithmetic, *comparisons, AstNodeType.DIVIDE]:
+  fold_kinds[node_type] = FOLD_BINARY
+for node_type in (AstNodeType.AND, AstNodeType.OR): # n-ary, one child per operand of the chain
+  fold_kinds[node_type] = FOLD_CHAIN
+fold_kinds[AstNodeType.IF] = FOLD_IF
+
+def constant(node): # the value of a number literal, None for anything else
+  if node.type != AstNodeType.NUMBER_LITERAL:
+    return None
+  try:
+    return int(node.value, 0)
+  except ValueError: # spellings like 010 are left to the assembler
+    return None
+
+def number(value, location):
+  return LiteralNode(AstNodeType.NUMBER_LITERAL, location, str(value & word_mask))
+
+def pure(node): # evaluating node has no effect besides its value
+  pending = [node]
+  while pending:
+    node = pending.pop()
+    if node.type in side_effects:
+      return False
+    pending.extend(child for child in node.children if child is not None)
+  return True
+
+class Folder:
+  def __init__(self):
+    self.folded = 0 # nodes replaced
+
+  def fold(self, root): # root with its subtrees folded in place, root itself may be replaced
+    order = [] # (node, parent, index in its children) in preorder, folded in reverse so children come first
+    pending = [(root, None, 0)]
+    while pending:
+      entry = pending.pop()
+      order.append(entry)
+      node = entry[0]
+      children = node.children
+      for index in range(len(children) - 1, -1, -1):
+        if children[index] is not None:
+          pending.append((children[index], node, index))
+    for node, parent, index in reversed(order):
+      replacement = self.fold_node(node)
+      if replacement is not node:
+        self.folded += 1
+        if parent is None:
+          root = replacement
+        else:
+          parent.children[index] = replacement
+    return root
+
+  def fold_node(self, node): # children are already folded
+    node_type = node.type
+    kind = fold_kinds[node_type]
+    if kind == FOLD_NONE:
+      return node
+    if kind == FOLD_LITERAL:
+      return number(int(node_type == AstNodeType.TRUE_LITERAL), node.location)
+    if kind == FOLD_UNARY:
+      value = constant(node.children[0])
+      if value is None:
+        return node
+      return number(-value if node_type == AstNodeType.MINUS else int(value & word_mask == 0), node.location)
+    if kind == FOLD_IF:
+      return self.fold_if(node)
+    if kind == FOLD_CHAIN:
+      return self.fold_chain(node)
+    left, right = node.children
+    a = constant(left)
+    b = constant(right)
+    if a is not None and b is not None:
+      a &= word_mask
+      b &= word_mask
+      if node_type in arithmetic:
+        return number(arithmetic[node_type](a, b), node.location)
+      if a > signed_max or b > signed_max:
+        return node
+      if node_type == AstNodeType.DIVIDE:
+        return number(a // b, node.location) if b else node
+      return number(int(comparisons[node_type](a, b)), node.location)
+    if node_type in associative and b is not None and left.type == node_type:
+      inner = constant(left.children[1])
+      if inner is not None: # (x op c1) op c2 is x op (c1 op c2)
+        left.children[1] = number(arithmetic[node_type](inner, b), right.location)
+        return self.fold_node(left)
+    return self.simplify(node, left, right, a, b)
+
+  def simplify(self, node, left, right, a, b): # identities with one constant operand
+    node_type = node.type
+    if node_type == AstNodeType.SUM:
+      if b == 0:
+        return left
+      if a == 0:
+        return right
+    elif node_type == AstNodeType.SUBTRACT:
+      if b == 0:
+        return left
+    elif node_type == AstNodeType.MULTIPLY:
+      if b == 1:
+        return left
+      if a == 1:
+        return right
+      if b == 0 and pure(left) or a == 0 and pure(right):
+        return number(0, node.location)
+    return node
+
+  def fold_chain(self, node): # operands of a "&&" or "||" chain after the first constant deciding it are never evaluated
+    deciding = int(node.type == AstNodeType.OR) # truth of the operand that ends the chain, and then its value
+    kept = []
+    for operand in node.children:
+      value = constant(operand)
+      if value is None:
+        kept.append(operand)
+      elif bool(value & word_mask) == bool(deciding):
+        if all(pure(earlier) for earlier in kept):
+          return number(deciding, node.location)
+        kept.append(operand) # the operands before it still run for their effects
+        break
+      # other constants don't change the value of the chain, they're dropped
+    if not kept:
+      return number(1 - deciding, node.location)
+    if len(kept) == 1: # a chain of one operand is still a truth value, not the operand itself
+      kept.append(number(1 - deciding, node.location))
+    if len(kept) == len(node.children):
+      return node
+    chain = AstNode(node.type, node.location)
+    chain.extend(kept)
+    return chain
+
+  def fold_if(self, node): # a constant condition keeps only the branch it takes
+    value = constant(node.children[0].children[0])
+    if value is None:
+      return node
+    if value & word_mask:
+      return branch(node.children[1], node.location)
+    if len(node.children) > 2 and node.children[2] is not None:
+      return branch(node.children[2], node.location)
+    return AstNode(AstNodeType.BLOCK, node.location)
+
+def branch(body, location): # the statement of an IF_BODY or ELSE_BODY, an empty block if there's none
+  if body.children:
+    return body.children[0]
+  return AstNode(AstNodeType.BLOCK, location)
+
+def fold(node):
+  return Folder().fold(node)
@@ -0,0 +1,184 @@
+import gc
+import sys
+import struct
+import zlib
+from array import array
+from defs import AstNodeType, IdentifierType, AstNode, NameNode, LiteralNode, DeclarationNode, FunctionNode, Parameter, Location, TypeInfo
+
+# node classes, in the order of their codes in a packed tree
+KIND_NODE = 0; KIND_NAME = 1; KIND_LITERAL = 2; KIND_DECLARATION = 3; KIND_FUNCTION = 4
+node_kinds = {
+  AstNode: KIND_NODE,
+  NameNode: KIND_NAME,
+  LiteralNode: KIND_LITERAL,
+  DeclarationNode: KIND_DECLARATION,
+  FunctionNode: KIND_FUNCTION,
+}
+ast_node_types = list(AstNodeType) # the values are contiguous from 0
+
+# flat preorder encoding of a list of trees, made of a few arrays instead of one object per node,
+# so it pickles and unpickles in a fraction of the time the nodes themselves would
+def pack(nodes):
+  kinds = array("B")
+  types = array("B")
+  offsets = array("I") # all locations are in the same source file
+  counts = array("I") # number of children
+  ints = array("i") # ids, types and sizes, parameter counts
+  strings = [] # names and literal values, each one once
+  string_ids = {}
+  string_refs = array("I") # index in strings of each name or value, in node order
+  def add_string(value):
+    string_id = string_ids.get(value)
+    if string_id is None:
+      string_id = string_ids[value] = len(strings)
+      strings.append(value)
+    string_refs.append(string_id)
+  pending = nodes[::-1]
+  while pending:
+    node = pending.pop()
+    kind = node_kinds[node.__class__]
+    kinds.append(kind)
+    types.append(node.type)
+    offsets.append(node.location.offset)
+    if kind != KIND_NODE:
+      if kind == KIND_LITERAL:
+        add_string(node.value)
+      else:
+        add_string(node.name)
+        ints.append(node.id)
+        if kind != KIND_NAME:
+          ints.append(node.type_info.type)
+          ints.append(node.type_info.size)
+          if kind == KIND_FUNCTION:
+            ints.append(len(node.parameters))
+            for parameter in node.parameters:
+              add_string(parameter.name)
+              ints.append(parameter.id)
+              ints.append(parameter.type_info.type)
+              ints.append(parameter.type_info.size)
+    children = node.children
+    counts.append(len(children))
+    pending.extend(children[::-1])
+  return (len(nodes), kinds, types, offsets, counts, ints, string_refs, strings)
+
+def unpack(packed, source): # the trees of pack, with their locations in source
+  collecting = gc.isenabled()
+  gc.disable() # trees have no cycles, and the collector would rescan the growing tree over and over
+  try:
+    return unpack_nodes(packed, source)
+  finally:
+    if collecting:
+      gc.enable()
+
+def unpack_nodes(packed, source): # ValueError if the arrays don't describe whole trees
+  try:
+    return unpack_arrays(*packed, source)
+  except (IndexError, ValueError) as error: # out of range indices, node or identifier types that don't exist
+    raise ValueError("corrupt packed tree") from error
+
+def unpack_arrays(num_nodes, kinds, types, offsets, counts, ints, string_refs, strings, source):
+  nodes = []
+  open_nodes = [] # [node, children left to read]
+  next_int = 0
+  next_string = 0
+  for index in range(len(kinds)):
+    kind = kinds[index]
+    if kind > KIND_FUNCTION:
+      raise ValueError(f"unknown node kind {kind}")
+    node_type = ast_node_types[types[index]]
+    location = Location(source, offsets[index])
+    if kind == KIND_NODE:
+      node = AstNode(node_type, location)
+    elif kind == KIND_LITERAL:
+      node = LiteralNode(node_type, location, strings[string_refs[next_string]])
+      next_string += 1
+    elif kind == KIND_NAME:
+      node = NameNode(node_type, location, strings[string_refs[next_string]], ints[next_int])
+      next_string += 1
+      next_int += 1
+    else:
+      name = strings[string_refs[next_string]]
+      name_id, identifier_type, size = ints[next_int:next_int + 3]
+      next_string += 1
+      next_int += 3
+      if kind == KIND_DECLARATION:
+        node = DeclarationNode(node_type, location, name, name_id, TypeInfo(IdentifierType(identifier_type), size))
+      else:
+        parameters = []
+        for _ in range(ints[next_int]):
+          parameter_id, parameter_type, parameter_size = ints[next_int + 1:next_int + 4]
+          parameters.append(Parameter(strings[string_refs[next_string]], parameter_id, TypeInfo(IdentifierType(parameter_type), parameter_size)))
+          next_string += 1
+          next_int += 3
+        next_int += 1
+        node = FunctionNode(node_type, location, name, name_id, TypeInfo(IdentifierType(identifier_type), size), parameters)
+    if open_nodes:
+      parent = open_nodes[-1]
+      parent[0].append(node)
+      parent[1] -= 1
+      if parent[1] == 0:
+        open_nodes.pop()
+    else:
+      nodes.append(node)
+    if counts[index]:
+      open_nodes.append([node, counts[index]])
+  if len(nodes) != num_nodes or open_nodes or next_int != len(ints) or next_string != len(string_refs):
+    raise ValueError("corrupt packed tree")
+  return nodes
+
+# on-disk form of a packed tree: a header, then each array as its raw bytes and the strings as one utf-8 blob
+FORMAT_MAGIC = b"ASTP"
+FORMAT_VERSION = 2
+header_format = "<4sHBII" # magic, version, byte order of the arrays, number of trees, crc32 of the sections
+section_format = "<I" # byte length of the section that follows
+array_codes = ["B", "B", "I", "I", "i", "I"] # kinds, types, offsets, counts, ints, string_refs
+
+def dumps(nodes):
+  num_nodes, *arrays, strings = pack(nodes)
+  string_lengths = array("I", map(len, strings))
+  sections = [array_section.tobytes() for array_section in arrays]
+  sections.append(string_lengths.tobytes())
+  sections.append("".join(strings).encode("utf-8", "surrogatepass"))
+  body = []
+  for section in sections:
+    body.append(struct.pack(section_format, len(section)))
+    body.append(section)
+  body = b"".join(body)
+  return struct.pack(header_format, FORMAT_MAGIC, FORMAT_VERSION, sys.byteorder == "little", num_nodes, zlib.crc32(body)) + body
+
+def loads(data, source): # ValueError if data isn't a tree of this format version, or was damaged
+  data = memoryview(data)
+  try:
+    magic, version, little_endian, num_nodes, checksum = struct.unpack_from(header_format, data)
+  except struct.error:
+    raise ValueError("truncated tree")
+  if magic != FORMAT_MAGIC or version != FORMAT_VERSION or little_endian != (sys.byteorder == "little"):
+    raise ValueError("incompatible tree format")
+  position = struct.calcsize(header_format)
+  if zlib.crc32(data[position:]) != checksum: # a damaged entry could still decode, to a different program
+    raise ValueError("corrupt tree")
+  sections = []
+  for _ in range(len(array_codes) + 2):
+    try:
+      (length,) = struct.unpack_from(section_format, data, position)
+    except struct.error:
+      raise ValueError("truncated tree")
+    position += struct.calcsize(section_format)
+    if position + length > len(data):
+      raise ValueError("truncated tree")
+    sections.append(data[position:position + length])
+    position += length
+  arrays = []
+  for code, section in zip(array_codes + ["I"], sections): # memoryviews would be read item by item by the array constructor
+    arrays.append(array(code))
+    arrays[-1].frombytes(section)
+  string_lengths = arrays.pop()
+  text = str(sections[-1], "utf-8", "surrogatepass")
+  strings = []
+  start = 0
+  for length in string_lengths:
+    strings.append(text[start:start + length])
+    start += length
+  if start != len(text) or position != len(data):
+    raise ValueError("corrupt tree")
+  return unpack((num_nodes, *arrays, strings), source)
@@ -0,0 +1,724 @@
+import os
+import re
+import sys
+import time
+import tempfile
+import contextlib
+import tracemalloc
+import lexer
+import astgen
+import compiler
+import codegen
+import ir
+import peephole
+import astopt
+import ordering
+import inliner
+import deadcode
+import astcache
+import pickle
+import profiler
+import dump
+from defs import TokenType
+
+# synthetic translation unit, shaped like our generated sources
+def generate_source(num_functions):
+  out = ["#include <stdio.h>\n", "char *msg = \"hello world\";\n"]
+  for idx in range(num_functions):
+    out.append(
+      f"int func{idx}(int a, int b) {{\n"
+      f"  int x = a * {idx} + (b - 0x1f) * 2;\n"
+      f"  char c = 'z';\n"
+      f"  if (x <= 3 && b == 4 || !a) {{\n"
+      f"    x = -x;\n"
+      f"  }} else {{\n"
+      f"    x = func{max(idx - 1, 0)}(x, b) + 1;\n"
+      f"  }}\n"
+      f"  while (x != 0) {{ x = x - 1; }}\n"
+      f"  return x >= b;\n"
+      f"}}\n"
+    )
+  return "".join(out)
+
+# synthetic translation unit restricted to what codegen handles
+def generate_program(num_functions):
+  out = []
+  for idx in range(num_functions):
+    out.append(
+      f"int func{idx}(int a, int b) {{\n"
+      f"  int x = a * {idx} + b;\n"
+      f"  int y = x - 2;\n"
+      f"  if (x <= y) {{\n"
+      f"    x = func{max(idx - 1, 0)}(x, b) + 1;\n"
+      f"  }} else {{\n"
+      f"    y = y * 2;\n"
+      f"  }}\n"
+      f"  return x + y;\n"
+      f"}}\n"
+    )
+  out.append(f"int main() {{\n  return func{num_functions - 1}(1, 2);\n}}\n")
+  return "".join(out)
+
+def timed(func, repeat=3):
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best, result
+
+def peak_memory(func):
+  tracemalloc.start()
+  start = time.perf_counter()
+  func()
+  elapsed = time.perf_counter() - start
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return elapsed, peak
+
+class CharwiseLexer(lexer.Lexer): # the character-at-a-time scanner the master pattern replaced, the baseline bench_lexer compares against
+  row = 0; col = 0
+
+  def __init__(self, file_path, text):
+    super().__init__(file_path, text)
+    self.stomach = []
+
+  def eof(self):
+    return self.cursor >= len(self.text)
+  
+  def incr(self, steps=1): # increment cursor while updating current row and col
+    for _ in range(0, steps):
+      if self.curchar() == "\n":
+        self.col = 0
+        self.row += 1
+      else:
+        self.col += 1
+      self.cursor += 1
+
+  def eat(self): # eat character and put in stomach
+    character = self.text[self.cursor]
+    self.stomach.append(character)
+    self.incr()
+    return character
+  
+  def digest(self): # digest current eaten characters
+    token_string = "".join(self.stomach)
+    self.stomach = []
+    return token_string
+  
+  def curchar(self, offset=0):
+    position = self.cursor + offset
+    if position >= len(self.text):
+      raise Exception("eof")
+    return self.text[position]
+  
+  def append(self, token_type, start, end=None): # token text spans from start to the cursor by default
+    end = self.cursor if end is None else end
+    name_id = 0
+    if token_type == TokenType.TOKEN_NAME:
+      name_id = self.interned.intern(self.text[start:end])
+      if self.interned.is_keyword(name_id):
+        token_type = self.interned.keyword_types[name_id]
+    self.tokens.append(token_type, start, end, name_id)
+
+  def lex(self):
+    while not self.eof():
+      if self.curchar() == "|" and self.curchar(1) == "|":
+        loc = self.cursor
+        self.incr(2)
+        self.append(TokenType.TOKEN_OR, loc)
+        continue
+      if self.curchar() == "&" and self.curchar(1) == "&":
+        loc = self.cursor
+        self.incr(2)
+        self.append(TokenType.TOKEN_AND, loc)
+        continue
+      if self.curchar() == "!" and self.curchar(1) == "=":
+        loc = self.cursor
+        self.incr(2)
+        self.append(TokenType.TOKEN_NOT_EQUAL, loc)
+        continue
+      if self.curchar() == "=" and self.curchar(1) == "=":
+        loc = self.cursor
+        self.incr(2)
+        self.append(TokenType.TOKEN_EQUAL_EQUAL, loc)
+        continue
+      if self.curchar() == ">" and self.curchar(1) == "=":
+        loc = self.cursor
+        self.incr(2)
+        self.append(TokenType.TOKEN_GTE, loc)
+        continue
+      if self.curchar() == "<" and self.curchar(1) == "=":
+        loc = self.cursor
+        self.incr(2)
+        self.append(TokenType.TOKEN_LTE, loc)
+        continue
+      for sym in lexer.sym_tokens.keys():
+        if self.curchar() == sym: # one character tokens (see sym_tokens)
+          self.incr()
+          self.append(lexer.sym_tokens[sym], self.cursor - 1)
+          if self.eof():
+            return
+        continue
+      if self.curchar().isspace():
+        self.incr()
+        continue
+      if self.curchar().isalpha(): # names (identifiers)
+        loc = self.cursor
+        self.eat()
+        while not self.eof() and (self.curchar().isalnum() or self.curchar() == "_"):
+          self.eat()
+        self.digest()
+        self.append(TokenType.TOKEN_NAME, loc)
+        continue
+      if self.curchar() == "#": # ignoring preprocessor 
+        while not self.eof() and self.curchar() != "\n":
+          self.incr()
+        continue
+      if self.curchar() == "/" and self.text[self.cursor + 1] == '/': # comments 
+        while not self.eof() and self.curchar() != "\n":
+          self.incr()
+        continue
+      if self.curchar() == "\"": # string literals
+        self.incr()
+        loc = self.cursor
+        while not self.eof() and self.curchar() != "\"":
+          self.eat()
+        self.digest()
+        self.append(TokenType.TOKEN_STRLIT, loc)
+        self.incr()
+        continue
+      if self.curchar() == "'": # character literals
+        self.incr()
+        loc = self.cursor
+        while not self.eof() and self.curchar() != "'":
+          self.eat()
+        self.digest()
+        self.append(TokenType.TOKEN_CHARLIT, loc)
+        self.incr()
+        continue
+      if self.curchar().isnumeric(): # number literals (5, 0b101, 0x5)
+        loc = self.cursor
+        self.eat()
+        while not self.eof() and (self.curchar().isnumeric() or self.curchar() in ["b", "x", "a", "c", "d", "e", "f"]):
+          self.eat()
+        self.digest()
+        self.append(TokenType.TOKEN_NUMBER, loc)
+        continue
+    return self.tokens
+
+def token_key(token):
+  return (token.type, token.text, token.location.row, token.location.col)
+
+def bench_lexer(num_functions):
+  text = generate_source(num_functions)
+  def run_charwise():
+    return CharwiseLexer("bench.c", text).lex()
+  charwise_time, charwise_tokens = timed(run_charwise, repeat=1)
+  regex_time, regex_tokens = timed(lambda: lexer.Lexer("bench.c", text).lex())
+  if list(map(token_key, charwise_tokens)) != list(map(token_key, regex_tokens)):
+    raise Exception("token streams differ")
+  size = len(text) / (1024 * 1024)
+  print(f"lexer: {len(regex_tokens)} tokens, {len(text)} chars")
+  print(f"  charwise: {charwise_time:.3f}s ({size / charwise_time:.2f} MiB/s)")
+  print(f"  regex:    {regex_time:.3f}s ({size / regex_time:.2f} MiB/s)")
+  print(f"  speedup:  {charwise_time / regex_time:.1f}x")
+  _, peak = peak_memory(lambda: lexer.Lexer("bench.c", text).lex())
+  print(f"  token store: {peak / len(regex_tokens):.1f} bytes/token")
+
+def bench_stream(num_functions):
+  text = generate_source(num_functions)
+  def parse(streaming):
+    lex = lexer.Lexer("bench.c", text, windowed=streaming)
+    parser = astgen.AstGen("bench.c", astgen.TokenStream(lex.tokenize(), lex.tokens) if streaming else lex.lex())
+    parser.parse()
+  print(f"parse: {len(text)} chars")
+  for streaming in [False, True]:
+    elapsed, peak = peak_memory(lambda: parse(streaming))
+    print(f"  {'stream' if streaming else 'list':6}: {elapsed:.3f}s, peak {peak / (1024 * 1024):.1f} MiB")
+
+def bench_mmap(num_functions):
+  with tempfile.NamedTemporaryFile("w", suffix=".c", delete=False) as f:
+    f.write(generate_source(num_functions))
+  try:
+    print(f"lexer input: {os.path.getsize(f.name)} bytes")
+    for mapped in [False, True]:
+      def run():
+        cc = compiler.Compiler(f.name, mapped=mapped)
+        lexer.Lexer(f.name, cc.text).lex()
+      elapsed, peak = peak_memory(run)
+      print(f"  {'mmap' if mapped else 'read':4}: {elapsed:.3f}s, peak {peak / (1024 * 1024):.1f} MiB")
+  finally:
+    os.unlink(f.name)
+
+def bench_relex(num_functions):
+  text = generate_source(num_functions)
+  lex = lexer.Lexer("bench.c", text)
+  tokens = lex.lex()
+  full_time, _ = timed(lambda: lexer.Lexer("bench.c", lex.text).lex())
+  num_edits = 200
+  start = time.perf_counter()
+  for idx in range(num_edits): # type and then delete a character in the middle of the file
+    offset = len(lex.text) // 2 + idx
+    tokens = lex.relex(tokens, offset, 0, "x")
+    tokens = lex.relex(tokens, offset, 1, "")
+  relex_time = (time.perf_counter() - start) / (num_edits * 2)
+  reference = lexer.Lexer("bench.c", lex.text).lex()
+  if (reference.types, reference.starts, reference.ends) != (tokens.types, tokens.starts, tokens.ends):
+    raise Exception("token streams differ")
+  print(f"relex: {len(tokens)} tokens, {len(text)} chars")
+  print(f"  full lex:    {full_time * 1000:.2f}ms")
+  print(f"  relex/edit:  {relex_time * 1000:.2f}ms")
+
+def parse_time(text, iterative=False):
+  def parse():
+    parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", text).lex(), iterative=iterative)
+    parser.parse()
+    if parser.program is None or len(parser.program.children) != 1:
+      raise Exception("parse failed")
+  return timed(parse)[0]
+
+def bench_expr(size):
+  sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+  shapes = {
+    "nested": lambda n: "(" * n + "a" + ")" * n,
+    "long": lambda n: " + ".join(["a * 2"] * n),
+    "assign": lambda n: " = ".join(["a"] * n) + " = 1",
+  }
+  for name, shape in shapes.items():
+    print(f"expr {name}:")
+    for n in [size // 8, size // 4, size // 2, size]:
+      elapsed = parse_time(f"int main() {{ return {shape(n)}; }}")
+      print(f"  n={n:6}: {elapsed * 1000:8.2f}ms ({elapsed / n * 1e6:.2f}us per level)")
+
+def bench_deep(size):
+  text = generate_source(size)
+  def parse(iterative):
+    parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", text).lex(), iterative=iterative)
+    parser.parse()
+  recursive_time, _ = timed(lambda: parse(False))
+  iterative_time, _ = timed(lambda: parse(True))
+  print(f"parse: {len(text)} chars")
+  print(f"  recursive: {recursive_time:.3f}s")
+  print(f"  iterative: {iterative_time:.3f}s")
+  depth = 100000 # far beyond the default recursion limit
+  shapes = {
+    "parens": "return " + "(" * depth + "a" + ")" * depth + ";",
+    "unary": "return " + "- " * depth + "a;",
+    "blocks": "{" * depth + "a;" + "}" * depth,
+    "else if": "if (a) a;" + " else if (a) a;" * depth,
+  }
+  for name, body in shapes.items():
+    elapsed = parse_time(f"int main() {{ {body} }}", iterative=True)
+    print(f"  {name:8} depth {depth}: {elapsed:.2f}s")
+
+def count_nodes(node):
+  count = 0
+  pending = [node]
+  while pending:
+    node = pending.pop()
+    count += 1
+    pending.extend(node.children)
+  return count
+
+def bench_ast(num_functions):
+  text = generate_source(num_functions)
+  tokens = lexer.Lexer("bench.c", text).lex()
+  def parse():
+    parser = astgen.AstGen("bench.c", tokens, iterative=True)
+    parser.parse()
+    return parser.program
+  parse_time, program = timed(parse)
+  num_nodes = count_nodes(program)
+  tracemalloc.start()
+  program = parse()
+  size = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  print(f"ast: {num_nodes} nodes, {len(text)} chars")
+  print(f"  parse:  {parse_time:.3f}s ({num_nodes / parse_time / 1000:.0f}k nodes/s)")
+  print(f"  memory: {size / (1024 * 1024):.1f} MiB ({size / num_nodes:.0f} bytes/node)")
+
+def bench_rules(num_functions):
+  text = generate_source(num_functions)
+  tokens = lexer.Lexer("bench.c", text).lex()
+  def parse(rule_profiler=None, iterative=False):
+    astgen.AstGen("bench.c", tokens, iterative=iterative, profiler=rule_profiler).parse()
+  plain_time, _ = timed(parse)
+  rule_profiler = profiler.RuleProfiler()
+  profiled_time, _ = timed(lambda: parse(rule_profiler), repeat=1)
+  print(f"parse: {len(text)} chars")
+  print(f"  plain:    {plain_time:.3f}s")
+  print(f"  profiled: {profiled_time:.3f}s")
+  print(rule_profiler.report())
+
+def dump_tree(program):
+  lines = []
+  pending = [(program, 0)]
+  while pending:
+    node, depth = pending.pop()
+    lines.append(re.sub(r" at 0x[0-9a-f]+", "", f"{depth} {node}")) # TypeInfo reprs carry addresses
+    pending.extend((child, depth + 1) for child in reversed(node.children))
+  return lines
+
+def bench_parallel(num_functions):
+  text = generate_source(num_functions)
+  tokens = lexer.Lexer("bench.c", text).lex()
+  def parse(jobs):
+    parser = astgen.AstGen("bench.c", tokens)
+    parser.parse_parallel(jobs)
+    return parser.program
+  serial_time, serial_program = timed(lambda: parse(1))
+  reference = dump_tree(serial_program)
+  print(f"parse: {len(text)} chars, {os.cpu_count()} cpus")
+  print(f"  serial:  {serial_time:.3f}s")
+  for jobs in [2, 4, 8, 16]:
+    if jobs > 2 * (os.cpu_count() or 1):
+      break
+    elapsed, program = timed(lambda: parse(jobs))
+    if dump_tree(program) != reference:
+      raise Exception("parallel tree differs")
+    print(f"  {jobs:2} jobs: {elapsed:.3f}s ({serial_time / elapsed:.2f}x)")
+
+def bench_cache(num_functions):
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "bench.c")
+    with open(path, "w") as f:
+      f.write(generate_source(num_functions))
+    cache_dir = os.path.join(directory, "cache")
+    def parse(cache):
+      return compiler.Compiler(path, cache_dir=cache_dir if cache else None).parse().program
+    parse_time, program = timed(lambda: parse(False))
+    parse(True) # fill the cache
+    hit_time, cached_program = timed(lambda: parse(True))
+    if dump_tree(cached_program) != dump_tree(program):
+      raise Exception("cached tree differs")
+    pickled = pickle.dumps(program)
+    pickle_time, _ = timed(lambda: pickle.loads(pickled))
+    entry_size = sum(entry.stat().st_size for entry in os.scandir(cache_dir))
+    print(f"cache: {os.path.getsize(path)} chars source, {entry_size} bytes entry, {len(pickled)} bytes pickled")
+    print(f"  lex + parse: {parse_time:.3f}s")
+    print(f"  cache hit:   {hit_time:.3f}s ({parse_time / hit_time:.1f}x)")
+    print(f"  unpickle:    {pickle_time:.3f}s")
+    cache = astcache.AstCache(cache_dir, max_size=entry_size * 3)
+    for idx in range(5): # distinct sources, only the most recent three fit
+      cache.store(cache.key(f"int main() {{ return {idx}; }}"), program.children)
+    print(f"  after 5 more stores: {len(os.listdir(cache_dir))} entries")
+
+def bench_pipeline(num_functions):
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "bench.c")
+    with open(path, "w") as f:
+      f.write(generate_program(num_functions))
+    print(f"compile: {os.path.getsize(path)} chars")
+    outputs = []
+    for pipelined in [False, True]:
+      def run():
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+          compiler.Compiler(path, pipelined=pipelined).compile()
+      elapsed, peak = peak_memory(run)
+      with open(path.replace(".c", ".s")) as f:
+        outputs.append(f.read())
+      print(f"  {'pipelined' if pipelined else 'whole':9}: {elapsed:.3f}s, peak {peak / (1024 * 1024):.1f} MiB")
+    if outputs[0] != outputs[1]:
+      raise Exception("assembly differs")
+
+def bench_dump(num_functions):
+  text = generate_source(num_functions)
+  tokens = lexer.Lexer("bench.c", text).lex()
+  parser = astgen.AstGen("bench.c", tokens)
+  parser.parse()
+  with open(os.devnull, "w") as devnull:
+    def print_nodes():
+      with contextlib.redirect_stdout(devnull):
+        parser.program.print()
+    print_time, _ = timed(print_nodes, repeat=1)
+    results = {}
+    for name, writer, items in [("tokens", dump.TokenWriter, tokens), ("ast", dump.AstWriter, None)]:
+      for json_lines in [False, True]:
+        def write():
+          out = dump.open_dump(os.devnull)
+          if items is None:
+            writer(out, json_lines).write(parser.program)
+          else:
+            writer(out, json_lines).write_all(items)
+          dump.close_dump(out)
+        results[name, json_lines] = timed(write, repeat=1)[0]
+  print(f"dump: {len(tokens)} tokens, {count_nodes(parser.program)} nodes")
+  print(f"  AstNode.print: {print_time:.3f}s")
+  for (name, json_lines), elapsed in results.items():
+    print(f"  {name:6} {'jsonl' if json_lines else 'text':5}: {elapsed:.3f}s")
+
+def bench_emit(num_functions):
+  for n in [num_functions // 4, num_functions // 2, num_functions]:
+    parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", generate_program(n)).lex(), iterative=True)
+    parser.parse()
+    def emit(streaming):
+      with open(os.devnull, "w") as devnull:
+        gen = codegen.CodeGen("bench.c", [devnull] if streaming else ())
+        gen.process(parser.program)
+        gen.emitter.flush()
+        return str(gen)
+    stream_time, _ = timed(lambda: emit(True))
+    memory_time, _ = timed(lambda: emit(False))
+    print(f"emit n={n:6}: streamed {stream_time:.3f}s ({stream_time / n * 1e6:.1f}us/function), in memory {memory_time:.3f}s ({memory_time / n * 1e6:.1f}us/function)")
+
+def bench_ir(num_functions):
+  parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", generate_program(num_functions)).lex(), iterative=True)
+  parser.parse()
+  gen = codegen.CodeGen("bench.c")
+  process_time, _ = timed(lambda: gen.process(parser.program))
+  items = gen.emitter.lines
+  instructions = sum(1 for item in items if item.__class__ is ir.Instruction)
+  blocks_time, blocks = timed(lambda: ir.basic_blocks(items))
+  render_time, text = timed(lambda: ir.render(items))
+  print(f"ir n={num_functions}: {instructions} instructions in {len(blocks)} blocks, process {process_time:.3f}s, blocks {blocks_time:.3f}s, render {render_time:.3f}s ({len(text) / render_time / 1e6:.1f}MB/s)")
+
+def count_instructions(text):
+  return sum(1 for line in text.split("\n") if line.startswith("\t") and line.strip())
+
+def bench_peephole(num_functions): # instructions left at each -O level
+  directory = os.path.dirname(os.path.abspath(__file__))
+  sources = []
+  for name in ["hello.c", "hello2.c"]:
+    with open(os.path.join(directory, name)) as f:
+      sources.append((name, f.read()))
+  sources.append((f"generated n={num_functions}", generate_program(num_functions)))
+  for name, text in sources:
+    parser = astgen.AstGen(name, lexer.Lexer(name, text).lex(), iterative=True)
+    parser.parse()
+    counts = []
+    for level in range(len(peephole.rule_levels)):
+      optimizer = peephole.Peephole(level)
+      def generate():
+        gen = codegen.CodeGen(name, passes=[optimizer] if level else [])
+        gen.process(parser.program)
+        return str(gen)
+      elapsed, text = timed(generate, repeat=1)
+      counts.append(count_instructions(text))
+      print(f"peephole {name} -O{level}: {counts[-1]} instructions ({counts[-1] / counts[0] * 100:.1f}%) in {elapsed:.3f}s, {optimizer.sweeps} sweeps")
+    applied = ", ".join(f"{rule} {count}" for rule, count in optimizer.applied.items() if count)
+    print(f"  rules at -O{level}: {applied or 'none'}")
+
+def bench_fold(num_functions):
+  text = generate_program(num_functions)
+  def parse():
+    parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", text).lex(), iterative=True)
+    parser.parse()
+    return parser.program
+  program = parse()
+  nodes = count_nodes(program)
+  folder = astopt.Folder()
+  fold_time, program = timed(lambda: folder.fold(program), repeat=1)
+  print(f"fold n={num_functions}: {nodes} nodes, {folder.folded} replaced in {fold_time:.3f}s ({fold_time / nodes * 1e9:.0f}ns/node)")
+  for folded in [False, True]:
+    program = parse()
+    if folded:
+      program = astopt.fold(program)
+    gen = codegen.CodeGen("bench.c", passes=[peephole.Peephole(1)])
+    gen.process(program)
+    print(f"  {'folded' if folded else 'as parsed'}: {count_instructions(str(gen))} instructions at -O1")
+
+def generate_wide(width): # a function whose return expression keeps width values live at once
+  terms = ["a", "b", "c", "g(a, b)"]
+  expression = "c"
+  for index in range(width):
+    expression = f"{terms[index % len(terms)]} {'+-*'[index % 3]} ({expression})"
+  return (
+    f"int g(int x, int y) {{\n  return x * 2 + y;\n}}\n"
+    f"int f(int a, int b) {{\n  int c = a + b;\n  return {expression};\n}}\n"
+    f"int main() {{\n  return f(3, 5);\n}}\n"
+  )
+
+def bench_regalloc(num_functions):
+  for width in [8, 16, 32, 64, 128]:
+    parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", generate_wide(width)).lex(), iterative=True)
+    parser.parse()
+    gen = codegen.CodeGen("bench.c")
+    gen.process(parser.program)
+    print(f"regalloc width={width:4}: {gen.allocator.spilled} spilled values, {count_instructions(str(gen))} instructions")
+  parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", generate_program(num_functions)).lex(), iterative=True)
+  parser.parse()
+  gen = codegen.CodeGen("bench.c")
+  elapsed, _ = timed(lambda: gen.process(parser.program), repeat=1)
+  print(f"regalloc n={num_functions}: {gen.allocator.spilled} spilled values, generated in {elapsed:.3f}s ({elapsed / num_functions * 1e6:.1f}us/function)")
+
+def generate_deep(width, right): # the same terms and operators nested to the right or to the left, without calls
+  terms = ["a", "b", "c", "(a + 1)"]
+  expression = "c"
+  for index in range(width):
+    term = terms[index % len(terms)]
+    operator = "+-*"[index % 3]
+    expression = f"{term} {operator} ({expression})" if right else f"({expression}) {operator} {term}"
+  return (
+    f"int f(int a, int b) {{\n  int c = a + b;\n  return {expression};\n}}\n"
+    f"int main() {{\n  return f(3, 5);\n}}\n"
+  )
+
+def bench_ordering(num_functions):
+  for width in [16, 64, 256]:
+    for right in [False, True]:
+      parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", generate_deep(width, right)).lex(), iterative=True)
+      parser.parse()
+      gen = codegen.CodeGen("bench.c")
+      gen.process(parser.program)
+      print(f"ordering width={width:4} {'right' if right else 'left '}-deep: {gen.labeling.swapped} swapped, {gen.allocator.spilled} spilled values, {count_instructions(str(gen))} instructions")
+  parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", generate_program(num_functions)).lex(), iterative=True)
+  parser.parse()
+  labeling = ordering.Labeling()
+  elapsed, _ = timed(lambda: labeling.label(parser.program), repeat=1)
+  nodes = count_nodes(parser.program)
+  print(f"ordering n={num_functions}: {nodes} nodes labeled in {elapsed:.3f}s ({elapsed / nodes * 1e9:.0f}ns/node), {labeling.swapped} swapped")
+
+def generate_helpers(num_functions): # small helpers called from bigger functions, the shape inlining is for
+  out = [
+    "int sum(int a, int b) {\n  return a + b;\n}\n",
+    "int scale(int a, int b) {\n  return a * 3 + b;\n}\n",
+  ]
+  for idx in range(num_functions):
+    out.append(
+      f"int func{idx}(int a, int b) {{\n"
+      f"  int x = sum(a, {idx});\n"
+      f"  int y = scale(x, b) - sum(2, 3);\n"
+      f"  if (sum(x, y) <= scale(1, 2)) {{\n"
+      f"    x = func{max(idx - 1, 0)}(x, b);\n"
+      f"  }} else {{\n"
+      f"    y = sum(y, y);\n"
+      f"  }}\n"
+      f"  return sum(x, y);\n"
+      f"}}\n"
+    )
+  out.append(f"int main() {{\n  return func{num_functions - 1}(1, 2);\n}}\n")
+  return "".join(out)
+
+def bench_inline(num_functions):
+  text = generate_helpers(num_functions)
+  for threshold in [0, 5, 16]:
+    parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", text).lex(), iterative=True)
+    parser.parse()
+    inlining = inliner.Inliner(threshold)
+    elapsed, program = timed(lambda: inlining.inline_program(parser.program), repeat=1)
+    gen = codegen.CodeGen("bench.c", passes=[peephole.Peephole(1)])
+    gen.process(astopt.fold(program))
+    asm = str(gen)
+    calls = sum(1 for line in asm.split("\n") if line.startswith("\tcall"))
+    print(f"inline n={num_functions} threshold={threshold:2}: {inlining.inlined} calls inlined in {elapsed:.3f}s, {inlining.dropped} functions dropped, {calls} calls and {count_instructions(asm)} instructions left at -O1")
+
+def generate_recursive(num_functions): # accumulating recursion, and functions ending in a call to the previous one
+  out = []
+  for idx in range(num_functions):
+    out.append(
+      f"int loop{idx}(int n, int acc) {{\n"
+      f"  if (n <= 0) {{\n"
+      f"    return acc;\n"
+      f"  }} else {{\n"
+      f"    return loop{idx}(n - 1, acc + n * {idx});\n"
+      f"  }}\n"
+      f"}}\n"
+      f"int chain{idx}(int a, int b) {{\n"
+      f"  int x = a * 2 + b;\n"
+      f"  return {f'chain{idx - 1}(x, b - 1)' if idx else f'loop{idx}(x, b)'};\n"
+      f"}}\n"
+    )
+  out.append(f"int main() {{\n  return chain{num_functions - 1}(1, 2);\n}}\n")
+  return "".join(out)
+
+def bench_tailcall(num_functions):
+  parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", generate_recursive(num_functions)).lex(), iterative=True)
+  parser.parse()
+  for tail_calls in [False, True]:
+    gen = codegen.CodeGen("bench.c", passes=[peephole.Peephole(1)], tail_calls=tail_calls)
+    elapsed, _ = timed(lambda: gen.process(parser.program), repeat=1)
+    asm = str(gen)
+    calls = sum(1 for line in asm.split("\n") if line.startswith("\tcall"))
+    print(f"tailcall n={num_functions} {'jumps' if tail_calls else 'calls'}: {gen.tail_jumps} tail calls as jumps, {calls} calls and {count_instructions(asm)} instructions left in {elapsed:.3f}s")
+
+def generate_library(num_functions): # helpers calling each other in chains of 10, main uses the first chain only
+  out = []
+  for idx in range(num_functions):
+    callee = f"lib{idx - 1}(a, b - 1)" if idx % 10 else "a"
+    out.append(
+      f"int lib{idx}(int a, int b) {{\n"
+      f"  int x = {callee} * 2 + b;\n"
+      f"  if (x <= 3) {{\n"
+      f"    return x;\n"
+      f"  }} else {{\n"
+      f"    x = x - 1;\n"
+      f"  }}\n"
+      f"  return x + a;\n"
+      f"  x = lib{idx // 2}(x, a);\n"
+      f"}}\n"
+    )
+  out.append(f"int main() {{\n  return lib{min(9, num_functions - 1)}(1, 2);\n}}\n")
+  return "".join(out)
+
+def bench_deadcode(num_functions):
+  text = generate_library(num_functions)
+  for eliminate in [False, True]:
+    parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", text).lex(), iterative=True)
+    parser.parse()
+    dead = deadcode.DeadCode()
+    elapsed, program = timed(lambda: dead.eliminate(parser.program) if eliminate else parser.program, repeat=1)
+    gen = codegen.CodeGen("bench.c", passes=[peephole.Peephole(1)])
+    generate_time, _ = timed(lambda: gen.process(program), repeat=1)
+    asm = str(gen)
+    print(f"deadcode n={num_functions} {'eliminated' if eliminate else 'kept      '}: {dead.functions} functions and {dead.statements} statements removed in {elapsed:.3f}s, {count_instructions(asm)} instructions ({len(asm)} bytes) generated in {generate_time:.3f}s")
+
+def generate_scoped(num_functions, num_locals=20): # functions with many locals, the block in each declares half of them again
+  out = []
+  for idx in range(num_functions):
+    outer = "".join(f"  int v{k} = a + {k};\n" for k in range(num_locals))
+    inner = "".join(f"    int v{k} = a * {k};\n" for k in range(0, num_locals, 2))
+    out.append(
+      f"int scoped{idx}(int a) {{\n"
+      f"{outer}"
+      f"  if (a <= {idx}) {{\n"
+      f"{inner}"
+      f"    a = v0 + v{num_locals - 2};\n"
+      f"  }} else {{\n"
+      f"    a = v1;\n"
+      f"  }}\n"
+      f"  return a + v0 + v{num_locals - 1};\n"
+      f"}}\n"
+    )
+  out.append(f"int main() {{\n  return scoped{num_functions - 1}(1);\n}}\n")
+  return "".join(out)
+
+def bench_scopes(num_functions):
+  text = generate_scoped(num_functions)
+  parser = astgen.AstGen("bench.c", lexer.Lexer("bench.c", text).lex(), iterative=True)
+  parse_elapsed, _ = timed(lambda: parser.parse(), repeat=1)
+  gen = codegen.CodeGen("bench.c")
+  generate_time, _ = timed(lambda: gen.process(parser.program), repeat=1)
+  print(f"scopes n={num_functions}: parsed in {parse_elapsed:.3f}s, {count_instructions(str(gen))} instructions generated in {generate_time:.3f}s")
+
+benchmarks = {
+  "lexer": bench_lexer,
+  "stream": bench_stream,
+  "mmap": bench_mmap,
+  "relex": bench_relex,
+  "expr": bench_expr,
+  "deep": bench_deep,
+  "ast": bench_ast,
+  "rules": bench_rules,
+  "parallel": bench_parallel,
+  "cache": bench_cache,
+  "pipeline": bench_pipeline,
+  "dump": bench_dump,
+  "emit": bench_emit,
+  "ir": bench_ir,
+  "peephole": bench_peephole,
+  "fold": bench_fold,
+  "regalloc": bench_regalloc,
+  "ordering": bench_ordering,
+  "inline": bench_inline,
+  "tailcall": bench_tailcall,
+  "deadcode": bench_deadcode,
+  "scopes": bench_scopes,
+}
+
+if __name__ == "__main__":
+  name = sys.argv[1] if len(sys.argv) > 1 else "lexer"
+  size = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+  benchmarks[name](size)
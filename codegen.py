@@ -1,74 +1,234 @@
+import gc
 import traceback
 from defs import TokenType, Token, AstNodeType, IdentifierType, AstNode, Location, CompilerError, token_names, TypeInfo
 from treelib import Node, Tree
 from functools import wraps
+import ir
+import regalloc
+import ordering
+import scopes
+
+class Emitter: # instructions in a list, printed once at the end or streamed to the outputs
+  def __init__(self, outputs=(), passes=()):
+    self.lines = [] # ir records
+    self.outputs = outputs # files written by flush, the lines are kept for getvalue if there are none
+    self.passes = passes # each with a run method rewriting a list of lines, applied by flush
+    self.optimized = 0 # lines before this one went through the passes already
+    self.base = 0 # number of lines already flushed, indices given out are absolute
+    self.slots = 0 # reserved lines not patched yet
+    self.labels = set() # labels emitted so far
+    self.forward = {} # label: lines referring to it before it was emitted
+
+  def emit(self, line):
+    self.lines.append(line)
+
+  def reserve(self): # a line whose content is only known later, returns its index for patch
+    self.lines.append(None)
+    self.slots += 1
+    return self.base + len(self.lines) - 1
+
+  def patch(self, index, line):
+    self.lines[index - self.base] = line
+    self.slots -= 1
+
+  def mark(self): # index of the next line
+    return self.base + len(self.lines)
+
+  def lines_from(self, index):
+    return self.lines[index - self.base:]
+
+  def replace_from(self, index, lines): # once nothing refers to those lines by index anymore
+    self.lines[index - self.base:] = lines
+
+  def refer(self, label): # the last line jumps to label
+    if label not in self.labels:
+      self.forward.setdefault(label, []).append(self.base + len(self.lines) - 1)
+
+  def define(self, label):
+    self.labels.add(label)
+    self.forward.pop(label, None)
+
+  def flush(self):
+    if self.slots or self.forward:
+      raise Exception(f"flushing {self.slots} unpatched lines and references to undefined labels {sorted(self.forward)}")
+    if self.passes and len(self.lines) > self.optimized: # nothing refers to these lines by index anymore
+      lines = self.lines[self.optimized:]
+      for optimization in self.passes:
+        lines = optimization.run(lines)
+      self.lines[self.optimized:] = lines
+      self.optimized = len(self.lines)
+    if self.outputs and self.lines:
+      chunk = ir.render(self.lines)
+      for out in self.outputs:
+        out.write(chunk)
+      self.base += len(self.lines)
+      self.lines = []
+      self.optimized = 0
+
+  def getvalue(self):
+    return ir.render(self.lines)
+
+def tail_returns(body): # returns only the epilogue runs after
+  found = []
+  pending = [body]
+  while pending:
+    statement = pending.pop()
+    if statement is None:
+      continue
+    if statement.type == AstNodeType.BLOCK:
+      if statement.children:
+        pending.append(statement.children[-1])
+    elif statement.type == AstNodeType.IF:
+      for branch in statement.children[1:]:
+        if branch is not None and branch.children:
+          pending.append(branch.children[0])
+    elif statement.type == AstNodeType.RETURN:
+      found.append(statement)
+  return found
 
 class CodeGen:
-  def __init__(self, file_path):
-    self.code = f"# {file_path}\n\nmov r0, main\ncall r0\nhlt\n"
-    self.regs = [False] * 16
+  def __init__(self, file_path, outputs=(), passes=(), tail_calls=False):
+    self.emitter = Emitter(outputs, passes)
+    self.tail_calls = tail_calls # a returned call reuses the frame, jumping to the callee instead of calling it
+    self.tail_jumps = 0 # returned calls compiled as jumps
+    for line in [f"# {file_path}", "", "mov r0, main", "call r0", "hlt"]: # entry stub, outside any function
+      self.emitter.emit(ir.Text(line))
+    self.allocator = regalloc.LinearScan()
+    self.labeling = ordering.Labeling()
+    self.second_first = set() # ids of the binary nodes of the current function evaluating their second operand first
+    self.next_reg = 0 # virtual registers are numbered per function, the allocator maps them to r0-r15
     self.in_func = False
+    self.function = None # declaration being generated
+    self.final_returns = set() # ids of its returns in tail position, the others jump to exit_label
+    self.exit_label = None # label before its epilogue, made for the first return that needs it
+    self.tail_returns = set() # ids of its returns compiled as tail calls
+    self.loop_label = None # label after its prologue, where self tail calls jump to
     self.current_var_declarations = 0
-    self.symbols = {}
-    self.stack_symbols = []
+    self.symbols = scopes.SymbolTable() # globals and functions, and the parameters and locals of the scopes open
     self.current_label = 0
 
-  def alloc_reg(self):
-    for idx, reg in enumerate(self.regs):
-      if not reg:
-        self.regs[idx] = True
-        return idx
+  def alloc_reg(self): # a fresh virtual register, it lives until its last use
+    reg = self.next_reg
+    self.next_reg += 1
+    return reg
+
+  def process_operands(self, node): # registers of a binary node's operands, in operand order whichever goes first
+    left, right = node.children
+    if id(node) in self.second_first:
+      rb = self.process(right)
+      return self.process(left), rb
+    return self.process(left), self.process(right)
 
-  def free_reg(self, reg):
-    if reg >= len(self.regs):
-      raise Exception(f"invalid reg {reg}")
-    self.regs[reg] = False
+  def tail_callee(self, call): # symbol of the function a returned call can jump to, None if it has to be called
+    callee = call.children[0].children[0]
+    if callee.type != AstNodeType.IDENTIFIER:
+      return None
+    symbol = self.symbols.lookup(callee.id)
+    if symbol is None or symbol["type"] != "func":
+      return None
+    count = len(call.children[1].children)
+    if count != symbol["params"] or count > len(self.function.parameters): # the arguments go in this function's argument slots
+      return None
+    return symbol
+
+  def tail_call(self, call):
+    symbol = self.tail_callee(call)
+    self.tail_jumps += 1
+    arguments = call.children[1].children
+    values = [self.process(argument) for argument in arguments] # all of them before any slot is written, they can read the parameters
+    for idx, value in enumerate(values):
+      slot_reg = self.alloc_reg()
+      self.emit("mov", ir.reg(slot_reg), ir.SF)
+      self.emit("add", ir.reg(slot_reg), ir.imm(2 + (len(values) - 1 - idx) * 2))
+      self.emit("mov", ir.mem(slot_reg), ir.reg(value))
+    if symbol["name"] == self.function.name: # the frame is already set up, the call becomes a loop
+      self.emit_jump("jmp", self.loop_label)
+    else:
+      self.emit("popa")
+      self.emit("mov", ir.SP, ir.SF)
+      self.emit("pop", ir.SF)
+      self.emit("jmp", ir.sym(symbol["name"])) # the callee returns to this function's caller
 
   def get_label(self):
     cur = self.current_label
     self.current_label += 1
     return cur
 
-  def append(self, line="", level=1):
-    for _ in range(level):
-      self.code += "\t"
-    self.code += f"{line}\n"
+  def emit(self, opcode, *operands):
+    self.emitter.emit(ir.Instruction(opcode, operands))
+
+  def emit_jump(self, opcode, label, *operands): # the label is the last operand
+    self.emit(opcode, *operands, ir.label(label))
+    self.emitter.refer(label)
 
-  def replace(self, find, repl):
-    self.code = self.code.replace(find, repl)
+  def emit_label(self, label):
+    self.emitter.emit(ir.Label(label))
+    self.emitter.define(label)
 
   def process(self, node):
     match node.type:
       case AstNodeType.PROGRAM:
-        self.append()
-        for prog_node in node.children:
-          self.process(prog_node)
+        self.emitter.emit(ir.blank)
+        collecting = gc.isenabled()
+        gc.disable() # instruction records have no cycles, and kept in memory the collector would rescan them over and over
+        try:
+          for prog_node in node.children:
+            self.process(prog_node)
+            self.emitter.flush() # a declaration is complete, nothing will patch it anymore
+        finally:
+          if collecting:
+            gc.enable()
       case AstNodeType.FUNCTION_DECLARATION:
-        self.append(f".{node.metadata['name']}:", level=0)
+        self.emitter.emit(ir.Label(node.name))
         self.in_func = True
-        self.append(f"push\tsf")
-        self.append(f"mov\tsf, sp")
-        self.append(f"LOCAL_STACK_INIT_PLACEHOLDER")
-        self.append(f"pusha")
-        self.symbols[node.metadata["name"]] = {"type": "func"}
-        for idx, param in enumerate(node.metadata["parameters"]):
-          self.symbols[param["name"]] = {"type": "stack", "pos": 2 + ((idx) * 2)}
-          self.stack_symbols.append(param["name"])
+        self.emit("push", ir.SF)
+        self.emit("mov", ir.SF, ir.SP)
+        stack_init = self.emitter.reserve() # patched once the locals and spill slots are counted
+        body = self.emitter.mark()
+        self.next_reg = 0
+        self.second_first = self.labeling.label(node)
+        self.emit("pusha")
+        self.symbols.declare(node.id, {"type": "func", "name": node.name, "params": len(node.parameters)})
+        self.symbols.enter() # the parameters' scope
+        self.function = node
+        final = tail_returns(node.children[0])
+        self.final_returns = {id(statement) for statement in final}
+        if self.tail_calls:
+          callees = {id(statement): self.tail_callee(statement.children[0]) for statement in final if statement.children and statement.children[0].type == AstNodeType.FUNCTION_CALL}
+          self.tail_returns = {key for key, symbol in callees.items() if symbol is not None}
+          if any(symbol is not None and symbol["name"] == node.name for symbol in callees.values()):
+            self.loop_label = self.get_label()
+            self.emit_label(self.loop_label)
+        for idx, param in enumerate(node.parameters):
+          self.symbols.declare(param.id, {"type": "stack", "pos": 2 + (len(node.parameters) - 1 - idx) * 2}) # arguments are pushed first to last, the last one is nearest
         self.process(node.children[0])
-        self.append(f"popa")
-        self.append(f"mov\tsp, sf")
-        self.append(f"pop\tsf")
-        self.append(f"ret")
-        if self.current_var_declarations > 0:
-          self.replace("LOCAL_STACK_INIT_PLACEHOLDER", f"sub\tsp, {str(self.current_var_declarations * 2)}")
+        if self.exit_label is not None:
+          self.emit_label(self.exit_label)
+        self.emit("popa")
+        self.emit("mov", ir.SP, ir.SF)
+        self.emit("pop", ir.SF)
+        self.emit("ret")
+        lines, spill_slots = self.allocator.allocate(self.emitter.lines_from(body), self.current_var_declarations)
+        self.emitter.replace_from(body, lines)
+        frame_slots = self.current_var_declarations + spill_slots
+        if frame_slots > 0:
+          self.emitter.patch(stack_init, ir.Instruction("sub", (ir.SP, ir.imm(frame_slots * 2))))
         else:
-          self.replace("LOCAL_STACK_INIT_PLACEHOLDER", "")
+          self.emitter.patch(stack_init, ir.blank)
         self.current_var_declarations = 0
-        self.symbols = {key: self.symbols[key] for key in self.symbols if key not in self.stack_symbols}
+        self.symbols.exit()
+        self.second_first = set() # the ids could come back for nodes of later declarations
+        self.final_returns = set()
+        self.exit_label = None
+        self.tail_returns = set()
+        self.loop_label = None
+        self.function = None
         self.in_func = False
       case AstNodeType.BLOCK:
+        self.symbols.enter() # locals declared in the block shadow the outer ones until its end
         for block_node in node.children:
           self.process(block_node)
+        self.symbols.exit()
       case AstNodeType.VARIABLE_DECLARATION:
         stack_pos = None
         if len(node.children) == 1:
@@ -76,86 +236,73 @@ class CodeGen:
         if self.in_func:
           self.current_var_declarations += 1
           stack_pos = -2 - ((self.current_var_declarations - 1) * 2)
-          self.symbols[node.metadata["name"]] = {"type": "stack", "pos": stack_pos}
-          self.stack_symbols.append(node.metadata["name"])
-          print(self.symbols)
+          self.symbols.declare(node.id, {"type": "stack", "pos": stack_pos})
         else:
-          self.symbols[node.metadata["name"]] = {"type": "data"}
+          self.symbols.declare(node.id, {"type": "data"})
         if len(node.children) == 1:
           sf_offset_reg = self.alloc_reg()
-          self.append(f"mov\tr{sf_offset_reg}, sf")
+          self.emit("mov", ir.reg(sf_offset_reg), ir.SF)
           if stack_pos > 0:
-            self.append(f"add\tr{sf_offset_reg}, {stack_pos}")
+            self.emit("add", ir.reg(sf_offset_reg), ir.imm(stack_pos))
           else:
-            self.append(f"sub\tr{sf_offset_reg}, {abs(stack_pos)}")
-          self.append(f"mov\t[r{sf_offset_reg}], r{reg}")
-          self.free_reg(sf_offset_reg)
-          self.free_reg(reg)
+            self.emit("sub", ir.reg(sf_offset_reg), ir.imm(abs(stack_pos)))
+          self.emit("mov", ir.mem(sf_offset_reg), ir.reg(reg))
       case AstNodeType.NUMBER_LITERAL:
         reg = self.alloc_reg()
-        self.append(f"mov\tr{reg}, {node.metadata['value']}")
+        self.emit("mov", ir.reg(reg), ir.imm(node.value))
         return reg
       case AstNodeType.STRING_LITERAL:
         reg = self.alloc_reg()
-        self.append(f"mov\tr{reg}, \"{node.metadata['value']}\"")
+        self.emit("mov", ir.reg(reg), ir.imm(f"\"{node.value}\""))
         return reg
       case AstNodeType.IDENTIFIER:
         reg = self.alloc_reg()
-        name = node.metadata["name"]
-        if name in self.symbols:
-          if self.symbols[name]["type"] == "stack":
-            stack_pos = self.symbols[name]["pos"]
-            self.append(f"mov\tr{reg}, sf")
+        symbol = self.symbols.lookup(node.id)
+        if symbol is not None:
+          if symbol["type"] == "stack":
+            stack_pos = symbol["pos"]
+            self.emit("mov", ir.reg(reg), ir.SF)
             if stack_pos > 0:
-              self.append(f"add\tr{reg}, {stack_pos}")
+              self.emit("add", ir.reg(reg), ir.imm(stack_pos))
             else:
-              self.append(f"sub\tr{reg}, {abs(stack_pos)}")
+              self.emit("sub", ir.reg(reg), ir.imm(abs(stack_pos)))
           else:
-            self.append(f"mov\tr{reg}, {node.metadata['name']}")
+            self.emit("mov", ir.reg(reg), ir.sym(node.name))
         else:
           raise Exception("double kek")
         return reg
       case AstNodeType.VALUE:
         addr = self.process(node.children[0])
         reg = self.alloc_reg()
-        self.append(f"mov\tr{reg}, [r{addr}]")
-        self.free_reg(addr)
+        self.emit("mov", ir.reg(reg), ir.mem(addr))
         return reg
       case AstNodeType.FUNCTION_CALL:
         func_reg = self.process(node.children[0]) # Callee expression
         num_args = self.process(node.children[1]) # Arguments for function call
-        self.append(f"call\tr{func_reg}")
+        self.emit("call", ir.reg(func_reg))
         if num_args > 0:
-          self.append(f"add\tsp, {num_args * 2}")
-        self.free_reg(func_reg)
+          self.emit("add", ir.SP, ir.imm(num_args * 2))
         ret_reg = self.alloc_reg()
-        self.append(f"mov\tr{ret_reg}, rv")
+        self.emit("mov", ir.reg(ret_reg), ir.RV)
         return ret_reg
       case AstNodeType.FUNCTION_CALL_CALLEE:
         return self.process(node.children[0])
       case AstNodeType.FUNCTION_CALL_ARGS:
         for arg_node in node.children:
           r = self.process(arg_node)
-          self.append(f"push\tr{r}")
-          self.free_reg(r)
+          self.emit("push", ir.reg(r))
         return len(node.children)
       case AstNodeType.SUM:
-        ra = self.process(node.children[0])
-        rb = self.process(node.children[1])
-        self.append(f"add\tr{ra}, r{rb}")
-        self.free_reg(rb)
+        ra, rb = self.process_operands(node)
+        self.emit("add", ir.reg(ra), ir.reg(rb))
         return ra
       case AstNodeType.SUBTRACT:
-        ra = self.process(node.children[0])
-        rb = self.process(node.children[1])
-        self.append(f"sub\tr{ra}, r{rb}")
-        self.free_reg(rb)
+        ra, rb = self.process_operands(node)
+        self.emit("sub", ir.reg(ra), ir.reg(rb))
         return ra
       case AstNodeType.MULTIPLY:
-        ra = self.process(node.children[0])
-        rb = self.process(node.children[1])
-        self.append(f"mul\tr{ra}, r{rb}")
-        self.free_reg(rb)
+        ra, rb = self.process_operands(node)
+        self.emit("mul", ir.reg(ra), ir.reg(rb))
         return ra
       case AstNodeType.ASSIGNMENT:
         match node.children[0].type:
@@ -166,26 +313,23 @@ class CodeGen:
           case _:
             raise Exception("invalid assignment")
         rb = self.process(node.children[1])
-        self.append(f"mov\t[r{ra}], r{rb}")
-        self.free_reg(ra)
-        self.free_reg(rb)
+        self.emit("mov", ir.mem(ra), ir.reg(rb))
       case AstNodeType.IF:
         cond_reg = self.process(node.children[0])
         ok_label = self.get_label()
         end_label = self.get_label()
         if node.children[2] != None:
           end_else_label = self.get_label()
-        self.append(f"jnz\tr{cond_reg}, L{ok_label}")
-        self.append(f"jmp\tL{end_label}")
-        self.append(f".L{ok_label}:", level=0)
-        self.free_reg(cond_reg)
+        self.emit_jump("jnz", ok_label, ir.reg(cond_reg))
+        self.emit_jump("jmp", end_label)
+        self.emit_label(ok_label)
         self.process(node.children[1])
         if node.children[2] != None:
-          self.append(f"jmp\tL{end_else_label}")
-        self.append(f".L{end_label}:", level=0)
+          self.emit_jump("jmp", end_else_label)
+        self.emit_label(end_label)
         if node.children[2] != None:
           self.process(node.children[2])
-          self.append(f".L{end_else_label}:", level=0)
+          self.emit_label(end_else_label)
       case AstNodeType.IF_BODY:
         self.process(node.children[0])
       case AstNodeType.ELSE_BODY:
@@ -195,28 +339,30 @@ class CodeGen:
       case AstNodeType.POINTER:
         reg = self.process(node.children[0])
         value_reg = self.alloc_reg()
-        self.append(f"mov\tr{value_reg}, [r{reg}]")
-        self.free_reg(reg)
+        self.emit("mov", ir.reg(value_reg), ir.mem(reg))
         return value_reg
       case AstNodeType.EQUAL:
-        ra = self.process(node.children[0])
-        rb = self.process(node.children[1])
-        self.append(f"cmp\tr{ra}, r{rb}")
-        self.append(f"flg\tr{ra}, FLAGS_EQUAL")
-        self.free_reg(rb)
+        ra, rb = self.process_operands(node)
+        self.emit("cmp", ir.reg(ra), ir.reg(rb))
+        self.emit("flg", ir.reg(ra), ir.sym("FLAGS_EQUAL"))
         return ra
       case AstNodeType.LESS_EQUAL_THAN:
-        ra = self.process(node.children[0])
-        rb = self.process(node.children[1])
-        self.append(f"cmp\tr{ra}, r{rb}")
-        self.append(f"flg\tr{ra}, FLAGS_LESSEQ")
-        self.free_reg(rb)
+        ra, rb = self.process_operands(node)
+        self.emit("cmp", ir.reg(ra), ir.reg(rb))
+        self.emit("flg", ir.reg(ra), ir.sym("FLAGS_LESSEQ"))
         return ra
       case AstNodeType.RETURN:
-        ret = self.process(node.children[0])
-        self.append(f"mov\trv, r{ret}")
-        self.free_reg(ret)
+        if id(node) in self.tail_returns and self.tail_callee(node.children[0]) is not None: # a local declared since could shadow the callee
+          self.tail_call(node.children[0])
+          return
+        if node.children:
+          ret = self.process(node.children[0])
+          self.emit("mov", ir.RV, ir.reg(ret))
+        if id(node) not in self.final_returns: # leaving from the middle of the function
+          if self.exit_label is None:
+            self.exit_label = self.get_label()
+          self.emit_jump("jmp", self.exit_label)
     #print(node)
 
-  def __str__(self):
-    return self.code
+  def __str__(self): # what wasn't streamed to the outputs
+    return self.emitter.getvalue()
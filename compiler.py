@@ -1,28 +1,146 @@
+import os
+import mmap
 import lexer
 import astgen
 import codegen
+import peephole
+import astopt
+import inliner
+import deadcode
+import profiler
+import astcache
+import dump
+from defs import SourceFile, TokenStore
 
 class Compiler:
-  def __init__(self, file_path):
+  def __init__(self, file_path, streaming=False, mapped=False, iterative=False, profile=None, jobs=1, cache_dir=None, cache_size=64 * 1024 * 1024, pipelined=False, dump_tokens=None, dump_ast=None, dump_asm=None, dump_format="text", optimize=0, inline_threshold=16, keep_inlined=False):
     self.file_path = file_path
+    self.optimize = optimize # 1 inlines small functions, folds constants, removes dead code, compiles tail calls as jumps and runs the peephole pass, 0 generates code for the tree as parsed
+    self.inline_threshold = inline_threshold # nodes in the returned expression of the functions inlined at -O1 and up, 0 inlines nothing
+    self.keep_inlined = keep_inlined # keep functions all calls to were inlined, always kept when pipelined
+    self.dump_tokens = dump_tokens # paths for the debug dumps, "-" for stdout, nothing is dumped by default
+    self.dump_ast = dump_ast
+    self.dump_asm = dump_asm
+    self.json_lines = dump_format == "jsonl"
+    self.dump_outputs = {} # open dump files by path, dumps given the same path share it
+    self.pipelined = pipelined # generate and write each top-level declaration as soon as it's parsed
+    self.cache_dir = cache_dir if cache_dir is not None else os.environ.get("AST_CACHE_DIR") # parsed trees are reused from here when the source didn't change
+    self.cache_size = cache_size
+    self.jobs = jobs # processes parsing top-level declarations, ignored when streaming
+    self.profile = profile if profile is not None else os.environ.get("PARSER_PROFILE") # where to write the per-rule report, "-" for stderr
+    self.iterative = iterative # parse with explicit stacks, so nesting depth isn't bound by the recursion limit
+    self.streaming = streaming # parse tokens as the lexer yields them instead of materializing the list
     try:
-      with open(file_path, "r") as f:
-        self.text = f.read()
+      if mapped: # lex straight from the page cache instead of reading the file into a str
+        with open(file_path, "rb") as f:
+          try:
+            self.text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+          except ValueError: # empty files can't be mapped
+            self.text = b""
+      else:
+        with open(file_path, "r") as f:
+          self.text = f.read()
     except:
       print(f"ERROR: couldn't open file {file_path}")
 
-  def compile(self):
-    lex = lexer.Lexer(self.file_path, self.text)
-    lex.lex()
+  def dump_output(self, path):
+    if path not in self.dump_outputs:
+      self.dump_outputs[path] = dump.open_dump(path)
+    return self.dump_outputs[path]
+
+  def close_dumps(self):
+    for out in self.dump_outputs.values():
+      dump.close_dump(out)
+    self.dump_outputs = {}
+
+  def dumped_tokens(self, tokens): # tokens, written to the token dump if there's one
+    if not self.dump_tokens:
+      return tokens
+    writer = dump.TokenWriter(self.dump_output(self.dump_tokens), self.json_lines)
+    if isinstance(tokens, TokenStore):
+      writer.write_all(tokens)
+      return tokens
+    return writer.tap(tokens)
+
+  def parse(self):
+    cache = astcache.AstCache(self.cache_dir, self.cache_size) if self.cache_dir and not self.dump_tokens else None # tokens aren't cached
+    if cache is not None:
+      key = cache.key(self.text)
+      declarations = cache.load(key, SourceFile(self.file_path, self.text))
+      if declarations is not None:
+        parser = astgen.AstGen(self.file_path, [])
+        parser.set_program(declarations)
+        return parser
+
+    if self.streaming: # the lexer keeps only the tokens the parser hasn't released
+      lex = lexer.Lexer(self.file_path, self.text, windowed=True)
+      tokens = astgen.TokenStream(self.dumped_tokens(lex.tokenize()), lex.tokens)
+    else:
+      lex = lexer.Lexer(self.file_path, self.text)
+      tokens = self.dumped_tokens(lex.lex())
+
+    rule_profiler = profiler.RuleProfiler() if self.profile else None
+    parser = astgen.AstGen(self.file_path, tokens, iterative=self.iterative, profiler=rule_profiler)
+    if self.jobs > 1 and not self.streaming:
+      parser.parse_parallel(self.jobs)
+    else:
+      parser.parse()
+    if rule_profiler is not None:
+      rule_profiler.write(self.profile)
+    if cache is not None and parser.error is None:
+      cache.store(key, parser.program.children)
+    return parser
 
-    parser = astgen.AstGen(self.file_path, lex.tokens)
-    parser.parse()
+  def asm_outputs(self, f): # the .s file, and the assembly dump if there's one
+    if self.dump_asm:
+      return [f, self.dump_output(self.dump_asm)]
+    return [f]
 
-    gen = codegen.CodeGen(self.file_path)
-    parser.print()
-    gen.process(parser.program)
+  def passes(self):
+    return [peephole.Peephole(self.optimize)] if self.optimize > 0 else []
 
+  def inliner(self, drop):
+    return inliner.Inliner(self.inline_threshold, drop) if self.optimize > 0 and self.inline_threshold > 0 else None
+
+  def compile_pipelined(self): # memory bound by the largest declaration instead of the whole file
+    lex = lexer.Lexer(self.file_path, self.text, windowed=True)
+    parser = astgen.AstGen(self.file_path, astgen.TokenStream(self.dumped_tokens(lex.tokenize()), lex.tokens), iterative=self.iterative)
+    ast_writer = dump.AstWriter(self.dump_output(self.dump_ast), self.json_lines) if self.dump_ast else None
+    parser.set_program([]) # stays empty, declarations are dropped once written
+    inlining = self.inliner(drop=False) # a declaration is written before later ones could show it's unreferenced
+    dead = deadcode.DeadCode() # likewise only statements after returns are removed, not unreached declarations
+    if ast_writer is not None:
+      ast_writer.write_node(parser.program, 0)
     with open(f"{self.file_path.replace('.c', '.s')}", "w") as f:
-      f.write(str(gen))
-    
-    print(gen)
\ No newline at end of file
+      gen = codegen.CodeGen(self.file_path, self.asm_outputs(f), self.passes(), tail_calls=self.optimize > 0)
+      gen.process(parser.program)
+      for declaration in parser.declarations():
+        if ast_writer is not None:
+          ast_writer.write(declaration, 1)
+        if inlining is not None:
+          declaration = inlining.inline(declaration)
+        if self.optimize > 0:
+          declaration = dead.prune(astopt.fold(declaration))
+        gen.process(declaration)
+        gen.emitter.flush()
+      gen.emitter.flush()
+
+  def compile(self):
+    try:
+      if self.pipelined:
+        return self.compile_pipelined()
+      parser = self.parse()
+      if self.dump_ast:
+        dump.AstWriter(self.dump_output(self.dump_ast), self.json_lines).write(parser.program)
+      inlining = self.inliner(drop=not self.keep_inlined)
+      if inlining is not None: # the dump shows the tree as parsed
+        parser.program = inlining.inline_program(parser.program)
+      if self.optimize > 0: # folded first, a branch folded away can leave functions unreached
+        parser.program = deadcode.eliminate(astopt.fold(parser.program))
+
+      with open(f"{self.file_path.replace('.c', '.s')}", "w") as f:
+        gen = codegen.CodeGen(self.file_path, self.asm_outputs(f), self.passes(), tail_calls=self.optimize > 0)
+        gen.process(parser.program)
+        gen.emitter.flush()
+    finally:
+      self.close_dumps()
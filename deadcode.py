@@ -0,0 +1,89 @@
+from defs import AstNodeType
+
+# removal of what can never run: statements after a return, and the functions and globals main doesn't reach
+# reachability goes by name, a function or global any identifier of a reached declaration names is reached,
+# whether it's called or only has its address taken
+
+declaration_types = (AstNodeType.FUNCTION_DECLARATION, AstNodeType.VARIABLE_DECLARATION)
+
+class DeadCode:
+  def __init__(self, entry="main"):
+    self.entry = entry # the function the entry stub calls
+    self.statements = 0 # statements removed after returns
+    self.functions = 0 # declarations removed
+    self.globals = 0
+
+  def eliminate(self, program): # program without its dead code, changed in place
+    for declaration in program.children:
+      self.prune(declaration)
+    self.sweep(program)
+    return program
+
+  def prune(self, declaration): # statements of a function after a return it always reaches, the declaration itself is kept
+    if declaration.type != AstNodeType.FUNCTION_DECLARATION or not declaration.children:
+      return declaration
+    order = [] # statements in preorder, done in reverse so nested ones come first
+    pending = [declaration.children[0]]
+    while pending:
+      statement = pending.pop()
+      if statement is None:
+        continue
+      order.append(statement)
+      if statement.type in (AstNodeType.BLOCK, AstNodeType.IF_BODY, AstNodeType.ELSE_BODY, AstNodeType.WHILE_BODY, AstNodeType.FOR_BODY):
+        pending.extend(statement.children)
+      elif statement.type in (AstNodeType.IF, AstNodeType.WHILE, AstNodeType.FOR):
+        pending.extend(child for child in statement.children[1:] if child is not None)
+    returning = set() # ids of the statements that return on every path
+    for statement in reversed(order):
+      statement_type = statement.type
+      if statement_type == AstNodeType.RETURN:
+        returning.add(id(statement))
+      elif statement_type == AstNodeType.BLOCK:
+        for index, child in enumerate(statement.children):
+          if id(child) in returning:
+            self.statements += len(statement.children) - index - 1
+            del statement.children[index + 1:]
+            returning.add(id(statement))
+            break
+      elif statement_type == AstNodeType.IF_BODY or statement_type == AstNodeType.ELSE_BODY:
+        if statement.children and id(statement.children[0]) in returning:
+          returning.add(id(statement))
+      elif statement_type == AstNodeType.IF: # both branches return, loops might not run their body at all
+        if len(statement.children) > 2 and all(branch is not None and id(branch) in returning for branch in statement.children[1:]):
+          returning.add(id(statement))
+    return declaration
+
+  def sweep(self, program): # top-level declarations the entry function can't reach
+    named = {} # id: declarations of that name
+    for declaration in program.children:
+      if declaration.type in declaration_types:
+        named.setdefault(declaration.id, []).append(declaration)
+    reached = set()
+    pending = []
+    for declaration in program.children:
+      if declaration.type not in declaration_types or declaration.type == AstNodeType.FUNCTION_DECLARATION and declaration.name == self.entry:
+        pending.append(declaration) # statements at the top level are kept, so is what they use
+    if not any(declaration.type == AstNodeType.FUNCTION_DECLARATION for declaration in pending):
+      return # no entry point, a library whose callers aren't known
+    for declaration in pending:
+      reached.add(id(declaration))
+    while pending:
+      node = pending.pop()
+      if node.type == AstNodeType.IDENTIFIER:
+        for declaration in named.get(node.id, ()):
+          if id(declaration) not in reached:
+            reached.add(id(declaration))
+            pending.append(declaration)
+      pending.extend(child for child in node.children if child is not None)
+    kept = []
+    for declaration in program.children:
+      if id(declaration) in reached:
+        kept.append(declaration)
+      elif declaration.type == AstNodeType.FUNCTION_DECLARATION:
+        self.functions += 1
+      else:
+        self.globals += 1
+    program.children = kept
+
+def eliminate(program):
+  return DeadCode().eliminate(program)
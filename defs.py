@@ -1,5 +1,7 @@
 import json
 from enum import IntEnum
+from array import array
+from bisect import bisect_right
 
 class TokenType(IntEnum):
   TOKEN_NAME = 0,
@@ -239,47 +241,173 @@ class TypeInfo:
   def __str__(self):
     return f"{identifier_type_names[self.type]}, Size: {self.size}"
     
+keyword_tokens = {
+  "return": TokenType.TOKEN_RETURN,
+  "int": TokenType.TOKEN_TYPEINT,
+  "char": TokenType.TOKEN_TYPECHAR,
+  "void": TokenType.TOKEN_TYPEVOID,
+  "if": TokenType.TOKEN_IF,
+  "while": TokenType.TOKEN_WHILE,
+  "for": TokenType.TOKEN_FOR,
+  "const": TokenType.TOKEN_CONST,
+  "true": TokenType.TOKEN_TRUE,
+  "false": TokenType.TOKEN_FALSE,
+  "else": TokenType.TOKEN_ELSE,
+}
+
+class InternTable: # per-compilation identifier ids, keywords are seeded first so they get the lowest ids
+  def __init__(self, binary=False):
+    self.ids = {} # keyed by str, or by bytes when lexing a bytes-like source
+    self.names = []
+    self.binary = binary
+    for keyword in keyword_tokens:
+      self.intern(keyword.encode() if binary else keyword)
+    self.keyword_types = list(keyword_tokens.values())
+    self.num_keywords = len(self.keyword_types)
+
+  def intern(self, name):
+    name_id = self.ids.get(name)
+    if name_id is None:
+      name_id = len(self.names)
+      self.ids[name] = name_id
+      self.names.append(name.decode() if self.binary else name)
+    return name_id
+
+  def is_keyword(self, name_id):
+    return name_id < self.num_keywords
+
+class SourceFile: # one per compiled file, shared by all of its tokens and locations
+  __slots__ = ("path", "text", "binary", "line_starts")
+
+  def __init__(self, path, text):
+    self.path = path
+    self.text = text # a str, or any bytes-like object such as an mmap of the file
+    self.binary = not isinstance(text, str)
+    self.line_starts = None # offsets where each line begins, built on first row/col lookup
+
+  def __reduce__(self): # mapped files are sent to other processes as bytes
+    text = self.text if isinstance(self.text, (str, bytes)) else bytes(self.text)
+    return (SourceFile, (self.path, text))
+
+  def raw(self, start, end): # zero-copy for bytes-like sources
+    if self.binary:
+      return memoryview(self.text)[start:end]
+    return self.text[start:end]
+
+  def slice(self, start, end):
+    if self.binary:
+      return str(memoryview(self.text)[start:end], "utf-8", "replace")
+    return self.text[start:end]
+
+  def row_col(self, offset): # 0-based
+    if self.line_starts is None:
+      line_starts = array("I", [0])
+      text = self.text
+      newline = b"\n" if self.binary else "\n"
+      position = text.find(newline)
+      while position != -1:
+        line_starts.append(position + 1)
+        position = text.find(newline, position + 1)
+      self.line_starts = line_starts
+    row = bisect_right(self.line_starts, offset) - 1
+    return row, offset - self.line_starts[row]
+
 class Location:
-  def __init__(self, file_path, row, col):
-    self.file_path = file_path
-    self.row = row + 1
-    self.col = col + 1
+  __slots__ = ("source", "offset")
+
+  def __init__(self, source, offset):
+    self.source = source
+    self.offset = offset
+
+  @property
+  def file_path(self):
+    return self.source.path
+
+  @property
+  def row(self):
+    return self.source.row_col(self.offset)[0] + 1
+
+  @property
+  def col(self):
+    return self.source.row_col(self.offset)[1] + 1
 
   def __str__(self):
-    return f"{self.file_path}:{self.row}:{self.col}"
-  
-class Token:
-  def __init__(self, token_type, text, location):
-    if token_type == TokenType.TOKEN_NAME:
-      match text:
-        case "return":
-          self.type = TokenType.TOKEN_RETURN
-        case "int":
-          self.type = TokenType.TOKEN_TYPEINT
-        case "char":
-          self.type = TokenType.TOKEN_TYPECHAR
-        case "void":
-          self.type = TokenType.TOKEN_TYPEVOID
-        case "if":
-          self.type = TokenType.TOKEN_IF
-        case "while":
-          self.type = TokenType.TOKEN_WHILE
-        case "for":
-          self.type = TokenType.TOKEN_FOR
-        case "const":
-          self.type = TokenType.TOKEN_CONST
-        case "true":
-          self.type = TokenType.TOKEN_TRUE
-        case "false":
-          self.type = TokenType.TOKEN_FALSE
-        case "else":
-          self.type = TokenType.TOKEN_ELSE
-        case _:
-          self.type = TokenType.TOKEN_NAME
-    else:
-      self.type = token_type
-    self.text = text
-    self.location = location
+    row, col = self.source.row_col(self.offset)
+    return f"{self.source.path}:{row + 1}:{col + 1}"
+
+class TokenStore: # struct-of-arrays storage for the tokens of a source file
+  def __init__(self, source, interned):
+    self.source = source
+    self.interned = interned
+    self.types = array("B")
+    self.starts = array("I") # span of the token text (without quotes for literals)
+    self.ends = array("I")
+    self.ids = array("I") # interned id of names and keywords, 0 for other tokens
+
+  def append(self, token_type, start, end, name_id=0):
+    self.types.append(token_type)
+    self.starts.append(start)
+    self.ends.append(end)
+    self.ids.append(name_id)
+
+  def truncate(self, length):
+    del self.types[length:]
+    del self.starts[length:]
+    del self.ends[length:]
+    del self.ids[length:]
+
+  def offset(self, index): # where the token begins in the source, opening quote included
+    offset = self.starts[index]
+    if self.types[index] in (TokenType.TOKEN_STRLIT, TokenType.TOKEN_CHARLIT):
+      offset -= 1
+    return offset
+
+  def match_end(self, index): # where the scanner resumes after the token, closing quote included
+    end = self.ends[index]
+    if self.types[index] in (TokenType.TOKEN_STRLIT, TokenType.TOKEN_CHARLIT) and end < len(self.source.text):
+      end += 1
+    return end
+
+  def __len__(self):
+    return len(self.types)
+
+  def __getitem__(self, index):
+    return Token(self, index)
+
+  def __iter__(self):
+    for index in range(len(self.types)):
+      yield Token(self, index)
+
+class Token: # view on one entry of a TokenStore
+  __slots__ = ("store", "index")
+
+  def __init__(self, store, index):
+    self.store = store
+    self.index = index
+
+  @property
+  def type(self):
+    return self.store.types[self.index]
+
+  @property
+  def id(self):
+    return self.store.ids[self.index]
+
+  @property
+  def text(self):
+    store = self.store
+    if store.types[self.index] == TokenType.TOKEN_NAME: # shared string from the intern table
+      return store.interned.names[store.ids[self.index]]
+    return store.source.slice(store.starts[self.index], store.ends[self.index])
+
+  @property
+  def raw(self):
+    store = self.store
+    return store.source.raw(store.starts[self.index], store.ends[self.index])
+
+  @property
+  def location(self):
+    return Location(self.store.source, self.store.offset(self.index))
 
   def is_type(self):
     match self.type:
@@ -291,18 +419,85 @@ class Token:
   def __str__(self):
     return f"{self.location}: {token_names[self.type]} \"{self.text}\""
 
+class TokenWindow(TokenStore): # a token store that can forget the tokens its reader is done with
+  def __init__(self, source, interned):
+    super().__init__(source, interned)
+    self.base = 0 # index of the first token still stored
+
+  def discard(self, position): # drop the tokens before position, indices of the others stay the same
+    count = position - self.base
+    if count > 0:
+      del self.types[:count]
+      del self.starts[:count]
+      del self.ends[:count]
+      del self.ids[:count]
+      self.base = position
+
+  def offset(self, index):
+    return super().offset(index - self.base)
+
+  def match_end(self, index):
+    return super().match_end(index - self.base)
+
+  def __len__(self):
+    return self.base + len(self.types)
+
+  def __getitem__(self, index):
+    return WindowToken(self, index)
+
+  def __iter__(self):
+    for index in range(self.base, len(self)):
+      yield WindowToken(self, index)
+
+class WindowToken(Token): # view on one entry of a TokenWindow, by absolute index
+  __slots__ = ()
+
+  @property
+  def type(self):
+    store = self.store
+    return store.types[self.index - store.base]
+
+  @property
+  def id(self):
+    store = self.store
+    return store.ids[self.index - store.base]
+
+  @property
+  def text(self):
+    store = self.store
+    index = self.index - store.base
+    if store.types[index] == TokenType.TOKEN_NAME:
+      return store.interned.names[store.ids[index]]
+    return store.source.slice(store.starts[index], store.ends[index])
+
+  @property
+  def raw(self):
+    store = self.store
+    index = self.index - store.base
+    return store.source.raw(store.starts[index], store.ends[index])
+
+no_children = () # shared by all leaves until something is appended
+
 class AstNode:
-  def __init__(self, node_type, location=None, metadata=None):
+  __slots__ = ("type", "location", "children")
+  fields = () # (label, attribute) of the payload shown by __str__
+
+  def __init__(self, node_type, location=None):
     self.type = node_type
     self.location = location
-    self.metadata = metadata
-    self.children = []
+    self.children = no_children
 
   def append(self, ast_node):
-    self.children.append(ast_node)
+    if self.children is no_children:
+      self.children = [ast_node]
+    else:
+      self.children.append(ast_node)
 
   def extend(self, ast_nodes):
-    self.children.extend(ast_nodes)
+    if self.children is no_children:
+      self.children = list(ast_nodes)
+    else:
+      self.children.extend(ast_nodes)
 
   def print(self, prefix=""):
     print(f"{prefix}└── {self}")
@@ -317,9 +512,8 @@ class AstNode:
 
   def __str__(self):
     out = f"{self.location}: {ast_names[self.type]}"
-    if self.metadata != None:
-      for meta in self.metadata.keys():
-        out += f", [{meta}: {self.metadata[meta]}]"
+    for label, attribute in self.fields:
+      out += f", [{label}: {getattr(self, attribute)}]"
     return out
   
   def generate(self, codegen):
@@ -327,6 +521,50 @@ class AstNode:
     for child in self.children:
       child.generate(codegen)
 
+class NameNode(AstNode): # identifiers
+  __slots__ = ("name", "id")
+  fields = (("name", "name"), ("id", "id"))
+
+  def __init__(self, node_type, location, name, name_id):
+    super().__init__(node_type, location)
+    self.name = name
+    self.id = name_id # interned id, what symbol tables are keyed by
+
+class LiteralNode(AstNode): # number, char and string literals
+  __slots__ = ("value",)
+  fields = (("value", "value"),)
+
+  def __init__(self, node_type, location, value):
+    super().__init__(node_type, location)
+    self.value = value
+
+class DeclarationNode(NameNode): # variable declarations
+  __slots__ = ("type_info",)
+  fields = NameNode.fields + (("type", "type_info"),)
+
+  def __init__(self, node_type, location, name, name_id, type_info):
+    super().__init__(node_type, location, name, name_id)
+    self.type_info = type_info
+
+class FunctionNode(DeclarationNode): # function declarations, type_info is the return type
+  __slots__ = ("parameters",)
+  fields = DeclarationNode.fields + (("parameters", "parameters"),)
+
+  def __init__(self, node_type, location, name, name_id, type_info, parameters):
+    super().__init__(node_type, location, name, name_id, type_info)
+    self.parameters = parameters
+
+class Parameter:
+  __slots__ = ("name", "id", "type_info")
+
+  def __init__(self, name, name_id, type_info):
+    self.name = name
+    self.id = name_id
+    self.type_info = type_info
+
+  def __repr__(self):
+    return f"{{'name': {self.name!r}, 'id': {self.id}, 'type': {self.type_info!r}}}"
+
 class CompilerError(Exception):
   def __init__(self, astgen, message, offset=0):
     self.location = astgen.get_current_location(offset=offset)
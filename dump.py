@@ -0,0 +1,89 @@
+import sys
+import json
+from defs import TypeInfo, Parameter, token_names, ast_names, identifier_type_names
+
+def open_dump(path): # "-" is stdout, files get a large buffer since dumps are written line by line
+  if path == "-":
+    return sys.stdout
+  return open(path, "w", buffering=1024 * 1024)
+
+def close_dump(out):
+  if out is sys.stdout:
+    out.flush()
+  else:
+    out.close()
+
+def json_value(value):
+  if isinstance(value, TypeInfo):
+    return {"type": identifier_type_names[value.type], "size": value.size}
+  if isinstance(value, list):
+    return [json_value(item) for item in value]
+  if isinstance(value, Parameter):
+    return {"name": value.name, "id": value.id, "type": json_value(value.type_info)}
+  return value
+
+class DumpWriter: # collects lines and writes them in batches, a write call per line is what made the old dumps slow
+  def __init__(self, out, json_lines=False, batch=4096):
+    self.out = out
+    self.json_lines = json_lines
+    self.batch = batch
+    self.lines = []
+
+  def line(self, text):
+    self.lines.append(text)
+    if len(self.lines) >= self.batch:
+      self.flush()
+
+  def flush(self):
+    if self.lines:
+      self.lines.append("")
+      self.out.write("\n".join(self.lines))
+      self.lines = []
+
+class TokenWriter(DumpWriter):
+  def write(self, token):
+    if self.json_lines:
+      location = token.location
+      row, col = location.source.row_col(location.offset)
+      self.line(json.dumps({
+        "token": token_names[token.type],
+        "text": token.text,
+        "offset": location.offset,
+        "row": row + 1,
+        "col": col + 1,
+      }))
+    else:
+      self.line(str(token))
+
+  def write_all(self, tokens):
+    for token in tokens:
+      self.write(token)
+    self.flush()
+
+  def tap(self, tokens): # passes tokens through, writing each one as it goes by
+    for token in tokens:
+      self.write(token)
+      yield token
+    self.flush()
+
+class AstWriter(DumpWriter): # same tree as AstNode.print, or one JSON object per node in preorder
+  def write_node(self, node, depth):
+    if self.json_lines:
+      location = node.location
+      row, col = location.source.row_col(location.offset)
+      record = {"depth": depth, "node": ast_names[node.type], "row": row + 1, "col": col + 1}
+      for label, attribute in node.fields:
+        record[label] = json_value(getattr(node, attribute))
+      self.line(json.dumps(record))
+    else:
+      self.line(f"{'    ' * depth}└── {node}")
+
+  def write(self, node, depth=0): # the whole subtree, without recursing
+    pending = [(node, depth)]
+    while pending:
+      node, depth = pending.pop()
+      self.write_node(node, depth)
+      children = node.children
+      for index in range(len(children) - 1, -1, -1):
+        pending.append((children[index], depth + 1))
+    self.flush()
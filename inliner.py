@@ -0,0 +1,254 @@
+from defs import AstNodeType, AstNode, NameNode, DeclarationNode
+import astopt
+import ordering
+
+# inlining of small leaf functions into their call sites, over the syntax tree before folding
+# a function is inlinable when its body is a single return of an expression without calls or assignments,
+# calls to it become a copy of that expression with its parameters bound to the arguments:
+# literals are put in place of the parameter, and so are variables and expressions read once when no argument makes a call,
+# anything else is evaluated once into a temporary declared before the statement
+
+substituted = (AstNodeType.NUMBER_LITERAL, AstNodeType.STRING_LITERAL) # arguments copied into the expression instead of a temporary
+
+not_inlined = [False] * len(AstNodeType) # statements whose own expressions are left alone, indexed by type
+for node_type in (AstNodeType.BLOCK, AstNodeType.WHILE, AstNodeType.FOR):
+  not_inlined[node_type] = True
+
+def return_statement(function): # the return of an inlinable function, None if it does more than return an expression
+  body = function.children[0] if function.children else None
+  if body is not None and body.type == AstNodeType.BLOCK and len(body.children) == 1:
+    body = body.children[0]
+  if body is None or body.type != AstNodeType.RETURN or len(body.children) != 1:
+    return None
+  if not astopt.pure(body.children[0]):
+    return None
+  return body
+
+def nodes(root): # every node under root, root included
+  found = []
+  pending = [root]
+  while pending:
+    node = pending.pop()
+    if node is not None:
+      found.append(node)
+      pending.extend(node.children)
+  return found
+
+def independent(a, b): # the two can be evaluated in either order
+  return not (a & ordering.EFFECT_CALL and b or b & ordering.EFFECT_CALL and a)
+
+class Inlinable:
+  def __init__(self, function, statement):
+    self.function = function
+    self.statement = statement # the return, folding in place can replace its expression
+    expression = statement.children[0]
+    self.free = set() # ids the expression refers to besides the parameters, a local of the caller can't shadow them
+    parameters = {parameter.id for parameter in function.parameters}
+    uses = dict.fromkeys(parameters, 0)
+    reads = dict.fromkeys(parameters, 0)
+    for node in nodes(expression):
+      if node.type == AstNodeType.IDENTIFIER:
+        if node.id in parameters:
+          uses[node.id] += 1
+        else:
+          self.free.add(node.id)
+      elif node.type == AstNodeType.VALUE and node.children[0].type == AstNodeType.IDENTIFIER and node.children[0].id in parameters:
+        reads[node.children[0].id] += 1
+    self.values = {parameter for parameter in parameters if uses[parameter] == reads[parameter]} # only ever read, a literal argument can replace them
+    self.once = {parameter for parameter in self.values if reads[parameter] <= 1} # any argument without calls can replace them
+
+class Inliner:
+  def __init__(self, threshold=16, drop=True):
+    self.threshold = threshold # nodes in a function's return expression for calls to it to be inlined, 0 inlines nothing
+    self.drop = drop # remove inlined functions nothing refers to anymore, only for whole programs
+    self.inlinable = {} # function id: Inlinable, for the functions seen so far
+    self.inlined = 0 # call sites replaced
+    self.expanded = set() # ids of the functions inlined somewhere
+    self.dropped = 0
+    self.next_temporary = -1 # ids of temporaries count down, interned ids are never negative
+
+  def inline_program(self, program):
+    for declaration in program.children:
+      self.inline(declaration)
+    if self.drop and self.inlined:
+      self.drop_unreferenced(program)
+    return program
+
+  def inline(self, declaration): # calls in declaration replaced, and declaration remembered if it's inlinable itself
+    if declaration.type != AstNodeType.FUNCTION_DECLARATION or not declaration.children:
+      return declaration
+    if self.inlinable:
+      self.inline_function(declaration)
+    statement = return_statement(declaration)
+    if statement is not None and len(nodes(statement.children[0])) <= self.threshold:
+      self.inlinable[declaration.id] = Inlinable(declaration, statement)
+    return declaration
+
+  def inline_function(self, function):
+    local = {parameter.id for parameter in function.parameters}
+    for node in nodes(function.children[0]):
+      if node.type == AstNodeType.VARIABLE_DECLARATION:
+        local.add(node.id)
+    pending = [(function, 0)] # (node, index in its children) of the statements to go through
+    while pending:
+      holder, index = pending.pop()
+      statement = holder.children[index]
+      if statement.type == AstNodeType.BLOCK:
+        children = []
+        for position in range(len(statement.children)):
+          children.extend(self.inline_statement(statement, position, local))
+          children.append(statement.children[position])
+        statement.children = children
+        for position in range(len(children)):
+          nested(statement, position, pending)
+        continue
+      temporaries = self.inline_statement(holder, index, local)
+      if temporaries: # a statement alone in an if or else, it gets a block for the temporaries
+        block = AstNode(AstNodeType.BLOCK, holder.children[index].location)
+        block.extend(temporaries + [holder.children[index]])
+        holder.children[index] = block
+        holder, index = block, len(temporaries)
+      nested(holder, index, pending)
+
+  def inline_statement(self, holder, index, local): # declarations of the temporaries the statement now needs first
+    statement = holder.children[index]
+    if statement.type == AstNodeType.IF:
+      holder, index = statement.children[0], 0 # only the condition is evaluated before the bodies
+      scope = holder.children[0]
+    elif not_inlined[statement.type]: # loops evaluate their conditions more than once
+      return []
+    else:
+      scope = statement
+    order = [] # (node, parent, index in its children), last child first, so reversed it's the order codegen evaluates them in
+    pending = [(scope, holder, index)]
+    function_call = AstNodeType.FUNCTION_CALL
+    while pending:
+      entry = pending.pop()
+      node = entry[0]
+      if node.type == function_call:
+        order.append(entry)
+      children = node.children
+      if children:
+        for position, child in enumerate(children):
+          if child is not None:
+            pending.append((child, node, position))
+    temporaries = []
+    for call, parent, position in reversed(order):
+      inlinable = self.callee(call, local)
+      if inlinable is None:
+        continue
+      arguments = call.children[1].children
+      arguments_effect = self.effects(call.children[1], local)
+      if arguments_effect & ordering.EFFECT_CALL: # a call could change what a later argument reads, only literals move
+        inlined = [argument.type in substituted and parameter.id in inlinable.values for parameter, argument in zip(inlinable.function.parameters, arguments)]
+      else:
+        inlined = [parameter.id in inlinable.once or parameter.id in inlinable.values and substitutable(argument) for parameter, argument in zip(inlinable.function.parameters, arguments)]
+      if not all(inlined) and not independent(self.effects(holder.children[index], local, call), arguments_effect):
+        continue # the temporaries can't be evaluated before the rest of the statement
+      parent.children[position] = self.expand(inlinable, arguments, inlined, temporaries)
+      self.inlined += 1
+      self.expanded.add(inlinable.function.id)
+    return temporaries
+
+  def callee(self, call, local): # the Inlinable a call is to, None if it can't be inlined
+    callee = call.children[0].children[0]
+    if callee.type != AstNodeType.IDENTIFIER or callee.id in local:
+      return None
+    inlinable = self.inlinable.get(callee.id)
+    if inlinable is None or inlinable.free & local:
+      return None
+    if len(call.children[1].children) != len(inlinable.function.parameters):
+      return None
+    return inlinable
+
+  def effects(self, root, local, skip=None): # ordering's EFFECT_ bits of the subtree, leaving out the one under skip
+    effect = 0
+    pending = [root]
+    while pending:
+      node = pending.pop()
+      if node is skip:
+        continue
+      if node.type == AstNodeType.FUNCTION_CALL: # inlinable functions only read
+        effect |= ordering.EFFECT_READ if self.callee(node, local) is not None else ordering.EFFECT_CALL
+      elif ordering.reading[node.type]:
+        effect |= ordering.EFFECT_READ
+      for child in node.children:
+        if child is not None:
+          pending.append(child)
+    return effect
+
+  def expand(self, inlinable, arguments, inlined, temporaries): # the returned expression for one call, new temporaries appended
+    literals = {} # parameter id: argument put in its place
+    renamed = {} # parameter id: (name, id) of its temporary
+    for parameter, argument, substitute in zip(inlinable.function.parameters, arguments, inlined):
+      if substitute:
+        literals[parameter.id] = argument
+        continue
+      name = f"{inlinable.function.name}.{parameter.name}"
+      temporary = DeclarationNode(AstNodeType.VARIABLE_DECLARATION, argument.location, name, self.next_temporary, parameter.type_info)
+      temporary.append(argument)
+      temporaries.append(temporary)
+      renamed[parameter.id] = (name, self.next_temporary)
+      self.next_temporary -= 1
+    return clone(inlinable.statement.children[0], literals, renamed, [])
+
+  def drop_unreferenced(self, program): # inlined functions nothing calls or takes the address of anymore
+    referenced = set()
+    for node in nodes(program):
+      if node.type == AstNodeType.IDENTIFIER:
+        referenced.add(node.id)
+    kept = []
+    for declaration in program.children:
+      if declaration.type == AstNodeType.FUNCTION_DECLARATION and declaration.id in self.expanded and declaration.id not in referenced and declaration.name != "main":
+        self.dropped += 1
+      else:
+        kept.append(declaration)
+    program.children = kept
+
+def substitutable(argument): # a literal or a variable, copies of it read the same value as long as nothing is called
+  if argument.type in substituted:
+    return True
+  return argument.type == AstNodeType.VALUE and argument.children[0].type == AstNodeType.IDENTIFIER
+
+def nested(holder, index, pending): # the statements under holder.children[index] to go through next
+  statement = holder.children[index]
+  if statement is None:
+    return
+  if statement.type == AstNodeType.BLOCK:
+    pending.append((holder, index))
+  elif statement.type == AstNodeType.IF:
+    for body in statement.children[1:]:
+      if body is not None and body.children:
+        pending.append((body, 0))
+
+slot_names = {} # node class: every slot of it and its bases
+
+def shallow_copy(node): # copy.copy, without its generic protocol that's most of the time spent copying
+  cls = node.__class__
+  names = slot_names.get(cls)
+  if names is None:
+    names = slot_names[cls] = [name for base in cls.__mro__ for name in base.__dict__.get("__slots__", ())]
+  duplicate = cls.__new__(cls)
+  for name in names:
+    setattr(duplicate, name, getattr(node, name))
+  return duplicate
+
+def clone(node, literals, renamed, placed=None): # a copy of the expression under node, parameters replaced by arguments or temporaries
+  if node.type == AstNodeType.VALUE:
+    variable = node.children[0]
+    if variable.type == AstNodeType.IDENTIFIER and variable.id in literals:
+      argument = literals[variable.id]
+      if placed is None or argument in placed: # the argument itself goes in once, further uses are literals or variables
+        return clone(argument, {}, {})
+      placed.append(argument)
+      return argument
+  elif node.type == AstNodeType.IDENTIFIER and node.id in renamed:
+    name, name_id = renamed[node.id]
+    return NameNode(AstNodeType.IDENTIFIER, node.location, name, name_id)
+  duplicate = shallow_copy(node)
+  if node.children:
+    duplicate.children = [clone(child, literals, renamed, placed) if child is not None else None for child in node.children]
+  return duplicate
+
+def inline(program, threshold=16, drop=True):
+  return Inliner(threshold, drop).inline_program(program)
@@ -0,0 +1,143 @@
+# instructions as records between CodeGen and the assembly text, so passes can work on them before printing
+
+# operand kinds
+OPERAND_REGISTER = 0 # value is the number of a general (or before allocation, virtual) register, or the name of sf, sp or rv
+OPERAND_IMMEDIATE = 1 # number, or literal in its source spelling
+OPERAND_SYMBOL = 2 # global, function or flag name
+OPERAND_LABEL = 3 # number of a local label
+OPERAND_MEMORY = 4 # word at the address held by a register, value as for OPERAND_REGISTER
+
+class Operand: # shared and never changed once made, passes build new ones
+  __slots__ = ("kind", "value", "text")
+
+  def __init__(self, kind, value):
+    self.kind = kind
+    self.value = value
+    self.text = operand_text(kind, value) # printed often, so spelled once
+
+  def __eq__(self, other):
+    if self is other: # the usual case, most operands are shared
+      return True
+    return isinstance(other, Operand) and self.kind == other.kind and self.value == other.value
+
+  def __hash__(self):
+    return hash((self.kind, self.value))
+
+  def __repr__(self):
+    return f"Operand({self.kind}, {self.value!r})"
+
+  def __str__(self):
+    return self.text
+
+def register_name(value):
+  return f"r{value}" if isinstance(value, int) else value
+
+def operand_text(kind, value):
+  if kind == OPERAND_REGISTER:
+    return register_name(value)
+  if kind == OPERAND_MEMORY:
+    return f"[{register_name(value)}]"
+  if kind == OPERAND_LABEL:
+    return f"L{value}"
+  return str(value)
+
+registers = [Operand(OPERAND_REGISTER, number) for number in range(16)]
+SF = Operand(OPERAND_REGISTER, "sf") # stack frame
+SP = Operand(OPERAND_REGISTER, "sp") # stack pointer
+RV = Operand(OPERAND_REGISTER, "rv") # return value
+
+def reg(number): # numbers past r15 are virtual registers, before allocation
+  if number >= len(registers):
+    registers.extend(Operand(OPERAND_REGISTER, extra) for extra in range(len(registers), number + 1))
+  return registers[number]
+
+immediates = {} # operands are shared, most programs use a handful of constants and names over and over
+symbols = {}
+memory = [Operand(OPERAND_MEMORY, number) for number in range(16)]
+
+def imm(value):
+  operand = immediates.get(value)
+  if operand is None:
+    operand = immediates[value] = Operand(OPERAND_IMMEDIATE, value)
+  return operand
+
+def sym(name):
+  operand = symbols.get(name)
+  if operand is None:
+    operand = symbols[name] = Operand(OPERAND_SYMBOL, name)
+  return operand
+
+def label(number):
+  return Operand(OPERAND_LABEL, number)
+
+def mem(number):
+  if not isinstance(number, int):
+    return Operand(OPERAND_MEMORY, number)
+  if number >= len(memory):
+    memory.extend(Operand(OPERAND_MEMORY, extra) for extra in range(len(memory), number + 1))
+  return memory[number]
+
+class Instruction:
+  __slots__ = ("opcode", "operands")
+
+  def __init__(self, opcode, operands=()):
+    self.opcode = opcode
+    self.operands = operands # tuple, destination first
+
+  def __repr__(self):
+    return f"Instruction({self.opcode!r}, {self.operands!r})"
+
+class Label: # a function name, or the number of a local label
+  __slots__ = ("name",)
+
+  def __init__(self, name):
+    self.name = name
+
+  def __repr__(self):
+    return f"Label({self.name!r})"
+
+class Text: # a line printed as is, the entry stub and blank lines
+  __slots__ = ("text",)
+
+  def __init__(self, text):
+    self.text = text
+
+  def __repr__(self):
+    return f"Text({self.text!r})"
+
+blank = Text("\t")
+
+branch_opcodes = {"jmp", "jnz", "ret", "hlt"} # control doesn't fall through to the next instruction, or may not
+
+def basic_blocks(items): # [start, end) index ranges, each block starts at a label or after a branch
+  blocks = []
+  start = None
+  for index, item in enumerate(items):
+    if item.__class__ is Label:
+      if start is not None:
+        blocks.append((start, index))
+      start = index
+    elif item.__class__ is Instruction:
+      if start is None:
+        start = index
+      if item.opcode in branch_opcodes:
+        blocks.append((start, index + 1))
+        start = None
+  if start is not None:
+    blocks.append((start, len(items)))
+  return blocks
+
+# printer for the Venere assembly syntax
+def render_item(item):
+  cls = item.__class__
+  if cls is Instruction:
+    if item.operands:
+      return f"\t{item.opcode}\t{', '.join([operand.text for operand in item.operands])}\n"
+    return f"\t{item.opcode}\n"
+  if cls is Label:
+    name = item.name
+    return f".L{name}:\n" if isinstance(name, int) else f".{name}:\n"
+  return f"{item.text}\n"
+
+def render(items):
+  return "".join(map(render_item, items))
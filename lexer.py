@@ -1,140 +1,138 @@
-from defs import TokenType, Token, Location
+import re
+from array import array
+from bisect import bisect_left
+from defs import TokenType, Token, Location, SourceFile, TokenStore, TokenWindow, InternTable, CompilerError
+
+sym_tokens = { # longest operators first, the master pattern tries alternatives in order
+  "||": TokenType.TOKEN_OR, "&&": TokenType.TOKEN_AND, "!=": TokenType.TOKEN_NOT_EQUAL,
+  "==": TokenType.TOKEN_EQUAL_EQUAL, ">=": TokenType.TOKEN_GTE, "<=": TokenType.TOKEN_LTE,
+  ";": TokenType.TOKEN_SEMICOL, "*": TokenType.TOKEN_STAR, ",": TokenType.TOKEN_COMMA,
+  "(": TokenType.TOKEN_OPAREN, ")": TokenType.TOKEN_CPAREN, "[": TokenType.TOKEN_OBRACK,
+  "]": TokenType.TOKEN_CBRACK, "{": TokenType.TOKEN_OCURLY, "}": TokenType.TOKEN_CCURLY,
+  ".": TokenType.TOKEN_DOT, "<": TokenType.TOKEN_LTS, ">": TokenType.TOKEN_GTS,
+  "?": TokenType.TOKEN_QUEST, "+": TokenType.TOKEN_PLUS, "-": TokenType.TOKEN_DASH,
+  "/": TokenType.TOKEN_SLASH, "|": TokenType.TOKEN_VERBAR, "&": TokenType.TOKEN_AMPERS,
+  "!": TokenType.TOKEN_EXCL, "=": TokenType.TOKEN_EQUAL,
+}
+
+# group numbers of the master pattern, dispatched on match.lastindex
+SCAN_SPACE = 1; SCAN_SKIP = 2; SCAN_NAME = 3; SCAN_NUMBER = 4
+SCAN_STRLIT = 5; SCAN_CHARLIT = 7; SCAN_SYM = 9
+
+master_spec = "|".join([
+  r"(\s+)",                # whitespace
+  r"(//[^\n]*|#[^\n]*)",   # comments and (ignored) preprocessor lines
+  r"([^\W\d]\w*)",         # names (identifiers and keywords)
+  r"(\d[\dbxacdef]*)",      # number literals (5, 0b101, 0x5)
+  r'("([^"]*)"?)',          # string literals
+  r"('([^']*)'?)",          # character literals
+  "(" + "|".join(re.escape(sym) for sym in sym_tokens) + ")",
+  r"(.)",                   # anything else is an error
+])
+master_pattern = re.compile(master_spec)
+
+# the same scanner over raw bytes (e.g. a memory-mapped file), names are ASCII only
+master_pattern_bytes = re.compile(master_spec.encode())
+sym_tokens_bytes = {sym.encode(): token_type for sym, token_type in sym_tokens.items()}
 
 class Lexer:
-  cursor = 0; row = 0; col = 0
-  stomach = []; tokens = []
+  cursor = 0
 
-  def __init__(self, file_path, text):
+  def __init__(self, file_path, text, interned=None, windowed=False):
     self.file_path = file_path
     self.text = text
+    self.source = SourceFile(file_path, text)
+    self.interned = InternTable(self.source.binary) if interned is None else interned
+    self.tokens = (TokenWindow if windowed else TokenStore)(self.source, self.interned) # a window when the reader discards what it consumed
 
-  def eof(self):
-    return self.cursor >= len(self.text)
-  
-  def incr(self, steps=1): # increment cursor while updating current row and col
-    for _ in range(0, steps):
-      if self.curchar() == "\n":
-        self.col = 0
-        self.row += 1
-      else:
-        self.col += 1
-      self.cursor += 1
+  def get_location(self):
+    return Location(self.source, self.cursor)
 
-  def eat(self): # eat character and put in stomach
-    character = self.text[self.cursor]
-    self.stomach.append(character)
-    self.incr()
-    return character
-  
-  def digest(self): # digest current eaten characters
-    token_string = "".join(self.stomach)
-    self.stomach = []
-    return token_string
-  
-  def curchar(self, offset=0):
-    position = self.cursor + offset
-    if position >= len(self.text):
-      raise Exception("eof")
-    return self.text[position]
-  
-  def append(self, token):
-    self.tokens.append(token)
+  def get_current_location(self, offset=0):
+    return self.get_location()
 
-  def get_location(self):
-    return Location(self.file_path, self.row, self.col)
-  
   def lex(self):
-    sym_tokens = { # map for cleaner code 
-      ";": TokenType.TOKEN_SEMICOL, "*": TokenType.TOKEN_STAR, ",": TokenType.TOKEN_COMMA,
-      "(": TokenType.TOKEN_OPAREN, ")": TokenType.TOKEN_CPAREN, "[": TokenType.TOKEN_OBRACK,
-      "]": TokenType.TOKEN_CBRACK, "{": TokenType.TOKEN_OCURLY, "}": TokenType.TOKEN_CCURLY,
-      ".": TokenType.TOKEN_DOT, "<": TokenType.TOKEN_LTS, ">": TokenType.TOKEN_GTS,
-      "?": TokenType.TOKEN_QUEST, "+": TokenType.TOKEN_PLUS, "-": TokenType.TOKEN_DASH,
-      "/": TokenType.TOKEN_SLASH, "|": TokenType.TOKEN_VERBAR, "&": TokenType.TOKEN_AMPERS,
-      "!": TokenType.TOKEN_EXCL, "=": TokenType.TOKEN_EQUAL,
-    }
-    while not self.eof():
-      # print(self.curchar())
-      if self.curchar() == "|" and self.curchar(1) == "|":
-        loc = self.get_location()
-        self.incr(2)
-        self.append(Token(TokenType.TOKEN_OR, "||", loc))
-        continue
-      if self.curchar() == "&" and self.curchar(1) == "&":
-        loc = self.get_location()
-        self.incr(2)
-        self.append(Token(TokenType.TOKEN_AND, "&&", loc))
-        continue
-      if self.curchar() == "!" and self.curchar(1) == "=":
-        loc = self.get_location()
-        self.incr(2)
-        self.append(Token(TokenType.TOKEN_NOT_EQUAL, "!=", loc))
-        continue
-      if self.curchar() == "=" and self.curchar(1) == "=":
-        loc = self.get_location()
-        self.incr(2)
-        self.append(Token(TokenType.TOKEN_EQUAL_EQUAL, "==", loc))
-        continue
-      if self.curchar() == ">" and self.curchar(1) == "=":
-        loc = self.get_location()
-        self.incr(2)
-        self.append(Token(TokenType.TOKEN_GTE, ">=", loc))
-        continue
-      if self.curchar() == "<" and self.curchar(1) == "=":
-        loc = self.get_location()
-        self.incr(2)
-        self.append(Token(TokenType.TOKEN_LTE, "<=", loc))
-        continue
-      for sym in sym_tokens.keys():
-        if self.curchar() == sym: # one character tokens (see sym_tokens)
-          self.append(Token(sym_tokens[sym], sym, self.get_location()))
-          self.incr()
-          if self.eof():
-            return
-        continue
-      if self.curchar().isspace():
-        self.incr()
-        continue
-      if self.curchar().isalpha(): # names (identifiers)
-        loc = self.get_location()
-        self.eat()
-        while not self.eof() and (self.curchar().isalnum() or self.curchar() == "_"):
-          self.eat()
-        digest = self.digest()
-        self.append(Token(TokenType.TOKEN_NAME, digest, loc))
-        continue
-      if self.curchar() == "#": # ignoring preprocessor 
-        while not self.eof() and self.curchar() != "\n":
-          self.incr()
-        continue
-      if self.curchar() == "/" and self.text[self.cursor + 1] == '/': # comments 
-        while not self.eof() and self.curchar() != "\n":
-          self.incr()
-        continue
-      if self.curchar() == "\"": # string literals
-        loc = self.get_location()
-        self.incr()
-        while not self.eof() and self.curchar() != "\"":
-          self.eat()
-        digest = self.digest()
-        self.append(Token(TokenType.TOKEN_STRLIT, digest, loc))
-        self.incr()
-        continue
-      if self.curchar() == "'": # character literals
-        loc = self.get_location()
-        self.incr()
-        while not self.eof() and self.curchar() != "'":
-          self.eat()
-        digest = self.digest()
-        self.append(Token(TokenType.TOKEN_CHARLIT, digest, loc))
-        self.incr()
+    for _ in self.scan():
+      pass
+    return self.tokens
+
+  def tokenize(self): # lazily yield tokens while scanning
+    tokens = self.tokens
+    for index in self.scan():
+      yield tokens[index]
+
+  def relex(self, previous, offset, removed, inserted): # re-lex only around an edit, returns the spliced tokens
+    old_text = previous.source.text
+    text = old_text[:offset] + inserted + old_text[offset + removed:]
+    delta = len(inserted) - removed
+    edit_end = offset + len(inserted)
+
+    # keep the tokens whose match, and the character that ended it, lie before the edit
+    keep = bisect_left(previous.ends, offset)
+    while keep and previous.match_end(keep - 1) >= offset:
+      keep -= 1
+    restart = previous.match_end(keep - 1) if keep else 0
+
+    self.text = text
+    self.source = SourceFile(previous.source.path, text)
+    self.tokens = tokens = TokenStore(self.source, previous.interned)
+    tokens.types = previous.types[:keep]
+    tokens.starts = previous.starts[:keep]
+    tokens.ends = previous.ends[:keep]
+    tokens.ids = previous.ids[:keep]
+
+    scanner = self.scan(restart)
+    for index in scanner:
+      start = tokens.offset(index)
+      if start < edit_end:
         continue
-      if self.curchar().isnumeric(): # number literals (5, 0b101, 0x5)
-        loc = self.get_location()
-        self.eat()
-        while not self.eof() and (self.curchar().isnumeric() or self.curchar() in ["b", "x", "a", "c", "d", "e", "f"]):
-          self.eat()
-        digest = self.digest()
-        self.append(Token(TokenType.TOKEN_NUMBER, digest, loc))
+      old_index = bisect_left(previous.starts, start - delta)
+      if old_index < len(previous) and previous.offset(old_index) == start - delta:
+        # both scans are at a token boundary over identical text, the rest is the old tail shifted
+        scanner.close()
+        tokens.truncate(index)
+        tokens.types.extend(previous.types[old_index:])
+        tokens.starts.extend(array("I", map(delta.__add__, previous.starts[old_index:])))
+        tokens.ends.extend(array("I", map(delta.__add__, previous.ends[old_index:])))
+        tokens.ids.extend(previous.ids[old_index:])
+        break
+    return tokens
+
+  def scan(self, position=0): # single pass over the text with the master pattern, yields the index of each new token
+    text = self.text
+    tokens = self.tokens
+    types = tokens.types; starts = tokens.starts; ends = tokens.ends; ids = tokens.ids
+    pattern, syms = (master_pattern_bytes, sym_tokens_bytes) if self.source.binary else (master_pattern, sym_tokens)
+    interned = self.interned
+    known_ids = interned.ids; intern = interned.intern
+    keyword_types = interned.keyword_types; num_keywords = interned.num_keywords
+    index = len(tokens) # indices are absolute, the store may discard tokens while the scan is suspended
+    for match in pattern.finditer(text, position):
+      kind = match.lastindex
+      if kind == SCAN_SPACE or kind == SCAN_SKIP:
         continue
-      
\ No newline at end of file
+      if kind == SCAN_NAME:
+        name = match.group(kind)
+        name_id = known_ids.get(name)
+        if name_id is None:
+          name_id = intern(name)
+        types.append(TokenType.TOKEN_NAME if name_id >= num_keywords else keyword_types[name_id])
+        ids.append(name_id)
+      else:
+        if kind == SCAN_SYM:
+          types.append(syms[match.group(kind)])
+        elif kind == SCAN_NUMBER:
+          types.append(TokenType.TOKEN_NUMBER)
+        elif kind == SCAN_STRLIT or kind == SCAN_CHARLIT:
+          types.append(TokenType.TOKEN_STRLIT if kind == SCAN_STRLIT else TokenType.TOKEN_CHARLIT)
+          kind += 1 # the group without quotes
+        else:
+          self.cursor = match.start()
+          raise CompilerError(self, f"unexpected character \"{self.source.slice(*match.span(kind))}\"")
+        ids.append(0)
+      start, end = match.span(kind)
+      starts.append(start)
+      ends.append(end)
+      yield index
+      index += 1
+    self.cursor = len(text)
@@ -1,9 +1,29 @@
 import os
-import sys
+import argparse
 import compiler
 
+argparser = argparse.ArgumentParser()
+argparser.add_argument("file_path")
+argparser.add_argument("--stream", action="store_true", help="parse while lexing, without materializing the token list")
+argparser.add_argument("--mmap", action="store_true", help="memory-map the source file and lex its raw bytes")
+argparser.add_argument("--iterative", action="store_true", help="parse with explicit stacks instead of recursion, for deeply nested sources")
+argparser.add_argument("--profile-parser", metavar="REPORT", help="write per-rule call counts and timings of the parser to REPORT (\"-\" for stderr), PARSER_PROFILE does the same")
+argparser.add_argument("--jobs", "-j", type=int, default=1, help="parse top-level declarations in this many processes")
+argparser.add_argument("--cache-dir", metavar="DIR", help="reuse parsed trees of unchanged sources from DIR, AST_CACHE_DIR does the same")
+argparser.add_argument("--cache-size", type=int, default=64, metavar="MIB", help="evict the least recently used trees beyond this size")
+argparser.add_argument("--pipeline", action="store_true", help="parse, generate and write one top-level declaration at a time, keeping memory bounded by the largest one")
+argparser.add_argument("--dump-tokens", nargs="?", const="-", metavar="PATH", help="write the tokens to PATH, stdout by default")
+argparser.add_argument("--dump-ast", nargs="?", const="-", metavar="PATH", help="write the syntax tree to PATH, stdout by default")
+argparser.add_argument("--dump-asm", nargs="?", const="-", metavar="PATH", help="write the assembly to PATH as well as the .s file, stdout by default")
+argparser.add_argument("-O", type=int, choices=[0, 1, 2], default=0, dest="optimize", help="1 inlines small functions, folds constant expressions, removes code main never reaches, turns tail calls into jumps and removes redundant instructions, 2 also pushes constants directly")
+argparser.add_argument("--inline-threshold", type=int, default=16, metavar="NODES", help="at -O1 and up, inline functions returning an expression of at most this many nodes, 0 disables inlining")
+argparser.add_argument("--keep-inlined", action="store_true", help="keep functions whose calls were all inlined")
+argparser.add_argument("--dump-format", choices=["text", "jsonl"], default="text", help="text tree or one JSON object per line")
+args = argparser.parse_args()
+
 cwd = os.getcwd()
-file_path = sys.argv[1]
 
-cc = compiler.Compiler(cwd + '/' + file_path)
+cc = compiler.Compiler(cwd + '/' + args.file_path, streaming=args.stream, mapped=args.mmap, iterative=args.iterative, profile=args.profile_parser, jobs=args.jobs, cache_dir=args.cache_dir, cache_size=args.cache_size * 1024 * 1024, pipelined=args.pipeline,
+  dump_tokens=args.dump_tokens, dump_ast=args.dump_ast, dump_asm=args.dump_asm, dump_format=args.dump_format, optimize=args.optimize,
+  inline_threshold=args.inline_threshold, keep_inlined=args.keep_inlined)
 cc.compile()
@@ -0,0 +1,82 @@
+from defs import AstNodeType
+
+# sethi-ullman labeling of expression trees, for the order codegen evaluates operands in
+# a binary node keeps its first operand's register until the second is done, so evaluating the operand that
+# needs more registers first keeps fewer values live at once, the instruction itself stays the same either way
+
+# what each node type needs, in lists indexed by the type like astopt's
+NEED_OTHER = 0; NEED_LEAF = 1; NEED_UNARY = 2; NEED_BINARY = 3; NEED_CALL = 4
+need_kinds = [NEED_OTHER] * len(AstNodeType)
+for node_type in (AstNodeType.NUMBER_LITERAL, AstNodeType.STRING_LITERAL, AstNodeType.IDENTIFIER):
+  need_kinds[node_type] = NEED_LEAF
+for node_type in (AstNodeType.VALUE, AstNodeType.POINTER, AstNodeType.CONDITION, AstNodeType.FUNCTION_CALL_CALLEE):
+  need_kinds[node_type] = NEED_UNARY
+for node_type in (AstNodeType.SUM, AstNodeType.SUBTRACT, AstNodeType.MULTIPLY, AstNodeType.EQUAL, AstNodeType.LESS_EQUAL_THAN):
+  need_kinds[node_type] = NEED_BINARY
+need_kinds[AstNodeType.FUNCTION_CALL] = NEED_CALL
+reading = [False] * len(AstNodeType) # loads from memory a call could change
+reading[AstNodeType.VALUE] = reading[AstNodeType.POINTER] = True
+
+# effects of a subtree as bits, operands are only swapped when neither can tell
+EFFECT_CALL = 1
+EFFECT_READ = 2
+
+class Labeling:
+  def __init__(self):
+    self.swapped = 0 # binary nodes whose second operand goes first
+
+  def label(self, root): # ids of the binary nodes under root whose second operand is evaluated first
+    order = [] # preorder, labeled in reverse so children come first
+    pending = [root]
+    while pending:
+      node = pending.pop()
+      order.append(node)
+      children = node.children
+      for index in range(len(children) - 1, -1, -1): # first child on top, it comes next in preorder
+        if children[index] is not None:
+          pending.append(children[index])
+    # in reverse preorder a node's children are done right before it, their results on top of the stacks first child first
+    needs = [] # registers live at most while evaluating each subtree
+    effects = [] # EFFECT_ bits of each subtree
+    second_first = set()
+    for node in reversed(order):
+      children = node.children
+      count = 0
+      effect = 0
+      for child in children:
+        if child is not None:
+          count += 1
+          effect |= effects[-count]
+      node_type = node.type
+      kind = need_kinds[node_type]
+      if kind == NEED_LEAF:
+        need = 1
+      elif kind == NEED_UNARY:
+        need = needs[-1]
+      elif kind == NEED_BINARY:
+        first = needs[-1]
+        second = needs[-2]
+        left_effect = effects[-1]
+        right_effect = effects[-2]
+        independent = not (left_effect & EFFECT_CALL and right_effect or right_effect & EFFECT_CALL and left_effect)
+        if second > first and independent:
+          second_first.add(id(node))
+          self.swapped += 1
+          need = max(second, first + 1)
+        else:
+          need = max(first, second + 1)
+      elif kind == NEED_CALL: # the callee's register is held while the arguments are evaluated and pushed
+        need = max(needs[-1], needs[-2] + 1) # the arguments node needs as much as its largest argument
+        effect |= EFFECT_CALL
+      else:
+        need = max(needs[-count:]) if count else 0
+      if reading[node_type]:
+        effect |= EFFECT_READ
+      if count:
+        del needs[-count:], effects[-count:]
+      needs.append(need)
+      effects.append(effect)
+    return second_first
+
+def label(root):
+  return Labeling().label(root)
@@ -0,0 +1,279 @@
+from ir import Instruction, Label, OPERAND_REGISTER, OPERAND_IMMEDIATE, OPERAND_MEMORY, SF, imm, mem
+
+# windowed rewrites of the instruction list, swept until none applies
+# rules see the items of the current sweep at index, what was already kept of it in out and the liveness of the sweep,
+# they return the number of items they consume and what replaces them, or None
+# every rule shortens the list, which is what makes the sweeps stop
+
+def is_register(operand): # general register, the ones codegen allocates
+  return operand.kind == OPERAND_REGISTER and operand.value.__class__ is int
+
+def is_any_register(operand):
+  return operand.kind == OPERAND_REGISTER
+
+def is_number(operand):
+  return operand.kind == OPERAND_IMMEDIATE and operand.value.__class__ is int
+
+def writes(instruction): # register an instruction overwrites, "all" after popa
+  opcode = instruction.opcode
+  if opcode == "popa":
+    return "all"
+  if opcode in writing_opcodes:
+    destination = instruction.operands[0]
+    if destination.kind == OPERAND_REGISTER:
+      return destination.value
+  return None
+
+overwriting_opcodes = {"mov", "flg", "pop"} # the first operand is written without being read
+writing_opcodes = {"mov", "flg", "pop", "add", "sub", "mul"}
+barrier_opcodes = {"jmp", "jnz"} # the other path could still read anything
+all_registers = (1 << 16) - 1
+
+def liveness(items): # for each item, the general registers read after it as a bit mask
+  live = [0] * len(items)
+  mask = 0 # nothing is read after the end of the declaration
+  for index in range(len(items) - 1, -1, -1):
+    live[index] = mask
+    item = items[index]
+    if item.__class__ is Label:
+      mask = all_registers # reached from elsewhere too
+    elif item.__class__ is Instruction:
+      opcode = item.opcode
+      if opcode in ("popa", "ret", "hlt"): # popa restores every register
+        mask = 0
+      elif opcode in barrier_opcodes or opcode == "pusha":
+        mask = all_registers
+      else:
+        operands = item.operands
+        if opcode in writing_opcodes:
+          destination = operands[0]
+          if destination.kind == OPERAND_REGISTER and destination.value.__class__ is int:
+            mask &= ~(1 << destination.value)
+        for position, operand in enumerate(operands):
+          kind = operand.kind
+          if (kind == OPERAND_MEMORY or kind == OPERAND_REGISTER and (position > 0 or opcode not in overwriting_opcodes)) and operand.value.__class__ is int:
+            mask |= 1 << operand.value
+  return live
+
+def dead(live, index, register): # the value of register after items[index] is never read
+  return not live[index] >> register & 1
+
+def window(first, second=None): # opcodes a rule's instructions can have, rules are only tried where they match
+  def mark(func):
+    func.first = first
+    func.second = second # None for rules that look at one instruction
+    return func
+  return mark
+
+@window(["mov"])
+def self_move(items, index, out, live): # mov rA, rA
+  instruction = items[index]
+  if is_any_register(instruction.operands[0]) and instruction.operands[0] == instruction.operands[1]:
+    return 1, []
+  return None
+
+@window(["mov"], ["mov"])
+def round_trip(items, index, out, live): # mov A, B / mov B, A, the second move changes nothing
+  first = items[index]
+  second = items[index + 1]
+  a, b = first.operands
+  if is_any_register(a) and is_any_register(b) and second.operands == (b, a):
+    return 2, [first]
+  return None
+
+@window(["mov", "flg", "add", "sub", "mul"])
+def dead_write(items, index, out, live): # an instruction whose only effect is a register nobody reads
+  instruction = items[index]
+  destination = instruction.operands[0]
+  if is_register(destination) and dead(live, index, destination.value):
+    return 1, []
+  return None
+
+@window(["mov"], ["mov"])
+def forward_copy(items, index, out, live): # mov rA, X / mov Y, rA with rA dead, Y takes X directly
+  first = items[index]
+  second = items[index + 1]
+  temporary, source = first.operands
+  destination, value = second.operands
+  if not is_register(temporary) or value != temporary or destination.kind == OPERAND_MEMORY and destination.value == temporary.value:
+    return None
+  if not is_register(destination) and not is_any_register(source): # only the forms codegen itself emits
+    return None
+  if not dead(live, index + 1, temporary.value):
+    return None
+  return 2, [Instruction("mov", (destination, source))]
+
+@window(["mov"], ["push"])
+def forward_push(items, index, out, live): # mov rA, B / push rA with rA dead, for registers B
+  first = items[index]
+  second = items[index + 1]
+  temporary, source = first.operands
+  if is_register(temporary) and second.operands[0] == temporary and is_any_register(source) and dead(live, index + 1, temporary.value):
+    return 2, [Instruction("push", (source,))]
+  return None
+
+operand_opcodes = {"push", "add", "sub", "mul", "cmp", "mov"} # their last operand is only read
+
+@window(["mov"], operand_opcodes)
+def forward_operand(items, index, out, live): # mov rA, X / op Y, rA with rA dead, op takes X directly
+  first = items[index]
+  second = items[index + 1]
+  temporary, source = first.operands
+  if not is_register(temporary) or source.kind == OPERAND_MEMORY or second.operands[-1] != temporary:
+    return None
+  if any(operand == temporary or operand.kind == OPERAND_MEMORY and operand.value == temporary.value for operand in second.operands[:-1]):
+    return None
+  if second.opcode == "mov" and second.operands[0].kind != OPERAND_MEMORY: # forward_copy's
+    return None
+  if not dead(live, index + 1, temporary.value):
+    return None
+  return 2, [Instruction(second.opcode, second.operands[:-1] + (source,))]
+
+@window(["mov"], ["add", "sub"])
+def fold_immediate(items, index, out, live): # mov rB, 5 / add rA, rB with rB dead, adds the constant itself
+  first = items[index]
+  second = items[index + 1]
+  temporary, source = first.operands
+  destination, value = second.operands
+  if not is_register(temporary) or value != temporary or destination == temporary:
+    return None
+  if source.kind != OPERAND_IMMEDIATE or str(source.value).startswith("\""): # the address of a string isn't a constant to add
+    return None
+  if not dead(live, index + 1, temporary.value):
+    return None
+  return 2, [Instruction(second.opcode, (destination, source))]
+
+@window(["add", "sub"])
+def zero_offset(items, index, out, live): # add rA, 0
+  instruction = items[index]
+  if is_register(instruction.operands[0]) and is_number(instruction.operands[1]) and instruction.operands[1].value == 0:
+    return 1, []
+  return None
+
+@window(["add", "sub"], ["add", "sub"])
+def combine_offsets(items, index, out, live): # add rA, 2 / sub rA, 4 is sub rA, 2
+  first = items[index]
+  second = items[index + 1]
+  if not is_register(first.operands[0]) or not is_number(first.operands[1]):
+    return None
+  if second.operands[0] != first.operands[0] or not is_number(second.operands[1]):
+    return None
+  offset = signed_offset(first) + signed_offset(second)
+  if offset == 0:
+    return 2, []
+  return 2, [Instruction("add" if offset > 0 else "sub", (first.operands[0], imm(abs(offset))))]
+
+def signed_offset(instruction):
+  value = instruction.operands[1].value
+  return value if instruction.opcode == "add" else -value
+
+address_window = 16 # instructions looked back at for a register still holding the same address
+
+@window(["mov"], ["add", "sub"])
+def reuse_address(items, index, out, live): # mov rB, sf / add rB, 4 when some rA still holds sf+4
+  first = items[index]
+  second = items[index + 1]
+  target = first.operands[0]
+  if first.operands[1] != SF or not is_register(target) or second.operands[0] != target or not is_number(second.operands[1]):
+    return None
+  written = set() # general registers changed between the earlier computation and this one
+  position = len(out) - 1
+  limit = max(position - address_window, 0)
+  while position > limit:
+    item = out[position]
+    if item.__class__ is Label:
+      return None
+    if item.__class__ is Instruction:
+      if item.opcode in barrier_opcodes or item.opcode in ("call", "popa", "pop") or writes(item) == "sf":
+        return None
+      previous = out[position - 1]
+      if (item.opcode == second.opcode and item.operands[1] == second.operands[1] and is_register(item.operands[0])
+          and previous.__class__ is Instruction and previous.opcode == "mov" and previous.operands == (item.operands[0], SF)):
+        holder = item.operands[0]
+        if holder.value in written:
+          return None
+        if holder == target:
+          return 2, []
+        return 2, [Instruction("mov", (target, holder))]
+      register = writes(item)
+      if register is not None:
+        written.add(register)
+    position -= 1
+  return None
+
+@window(["mov"], ["mov"])
+def copy_address(items, index, out, live): # mov rB, rA / mov rC, [rB] with rB dead addresses through rA
+  first = items[index]
+  second = items[index + 1]
+  temporary, source = first.operands
+  if not is_register(temporary) or not is_register(source):
+    return None
+  destination, value = second.operands
+  if destination == temporary or value == temporary:
+    return None
+  if value == mem(temporary.value):
+    operands = (destination, mem(source.value))
+  elif destination == mem(temporary.value):
+    operands = (mem(source.value), value)
+  else:
+    return None
+  if not dead(live, index + 1, temporary.value):
+    return None
+  return 2, [Instruction("mov", operands)]
+
+rule_levels = [
+  [], # -O0
+  [self_move, round_trip, dead_write, forward_copy, forward_push, fold_immediate, zero_offset, combine_offsets, reuse_address, copy_address],
+  [forward_operand], # -O2, constants and special registers as operands where codegen only ever used general registers
+]
+
+class Peephole:
+  def __init__(self, level=1):
+    self.rules = [rule for rules in rule_levels[:level + 1] for rule in rules]
+    self.dispatch = {} # (opcode, next opcode or None): rules whose window matches, in order, filled as pairs show up
+    self.applied = {rule.__name__: 0 for rule in self.rules} # how often each rule fired
+    self.sweeps = 0
+
+  def matching(self, first, second):
+    rules = []
+    for rule in self.rules:
+      if first in rule.first and (rule.second is None or second in rule.second):
+        rules.append(rule)
+    self.dispatch[first, second] = rules
+    return rules
+
+  def run(self, items): # the optimized items, items itself isn't changed
+    dispatch = self.dispatch
+    applied = self.applied
+    changed = bool(self.rules)
+    while changed:
+      changed = False
+      self.sweeps += 1
+      out = []
+      live = liveness(items)
+      index = 0
+      while index < len(items):
+        item = items[index]
+        if item.__class__ is Instruction:
+          following = items[index + 1] if index + 1 < len(items) else None
+          pair = (item.opcode, following.opcode if following.__class__ is Instruction else None)
+          rules = dispatch.get(pair)
+          if rules is None:
+            rules = self.matching(*pair)
+          for rule in rules:
+            match = rule(items, index, out, live)
+            if match is not None:
+              length, replacement = match
+              out.extend(replacement)
+              index += length
+              applied[rule.__name__] += 1
+              changed = True
+              break
+          else:
+            out.append(item)
+            index += 1
+        else:
+          out.append(item)
+          index += 1
+      items = out
+    return items
@@ -0,0 +1,65 @@
+import sys
+import time
+
+class RuleProfiler: # call counts and timings of the methods it wraps, nothing is hooked unless instrument() is called
+  def __init__(self):
+    self.calls = {}
+    self.cumulative = {} # ns in the outermost activation of each rule, nested calls included
+    self.own = {} # ns in each rule itself, nested rules excluded
+    self.active = {} # activations of each rule currently on the stack
+    self.max_recursion = {}
+    self.children = [0] # ns spent in nested rules, one entry per active rule
+    self.max_depth = 0
+
+  def wrap(self, name, method):
+    for table in (self.calls, self.cumulative, self.own, self.active, self.max_recursion):
+      table.setdefault(name, 0)
+    calls, cumulative, own, active, max_recursion = self.calls, self.cumulative, self.own, self.active, self.max_recursion
+    children = self.children
+    clock = time.perf_counter_ns
+    def wrapper(*args, **kwargs):
+      calls[name] += 1
+      recursion = active[name] + 1
+      active[name] = recursion
+      if recursion > max_recursion[name]:
+        max_recursion[name] = recursion
+      children.append(0)
+      if len(children) - 1 > self.max_depth:
+        self.max_depth = len(children) - 1
+      start = clock()
+      try:
+        return method(*args, **kwargs)
+      finally:
+        elapsed = clock() - start
+        own[name] += elapsed - children.pop()
+        children[-1] += elapsed
+        active[name] = recursion - 1
+        if recursion == 1:
+          cumulative[name] += elapsed
+    return wrapper
+
+  def instrument(self, obj, names): # shadow the methods with wrappers on this instance only
+    for name in names:
+      setattr(obj, name, self.wrap(name, getattr(obj, name)))
+
+  def report(self):
+    total = sum(self.own.values()) or 1
+    lines = [
+      f"{'rule':32} {'calls':>10} {'cumulative':>12} {'own':>12} {'own %':>7} {'recursion':>10}",
+    ]
+    for name in sorted(self.calls, key=lambda name: self.own[name], reverse=True):
+      if self.calls[name] == 0:
+        continue
+      lines.append(
+        f"{name:32} {self.calls[name]:10} {self.cumulative[name] / 1e6:10.2f}ms {self.own[name] / 1e6:10.2f}ms"
+        f" {self.own[name] / total * 100:6.1f}% {self.max_recursion[name]:10}"
+      )
+    lines.append(f"max depth: {self.max_depth}")
+    return "\n".join(lines) + "\n"
+
+  def write(self, path): # "-" writes to stderr
+    if path == "-":
+      sys.stderr.write(self.report())
+    else:
+      with open(path, "w") as f:
+        f.write(self.report())
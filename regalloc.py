@@ -0,0 +1,142 @@
+from ir import Instruction, Label, OPERAND_REGISTER, OPERAND_MEMORY, OPERAND_LABEL, SF, reg, mem, imm
+
+# linear scan register allocation for the instructions of one function
+# codegen numbers a fresh virtual register for every value, here they are mapped to r0-r15,
+# and the ones that don't fit live in frame slots, loaded and stored around each instruction using them
+
+num_registers = 16
+scratch = [14, 15] # set aside for spill code once a function needs any, an instruction names at most two registers
+overwriting_opcodes = {"mov", "flg", "pop"} # the first operand is written without being read
+writing_opcodes = {"mov", "flg", "pop", "add", "sub", "mul"}
+
+def intervals(items): # virtual register: [first position, last position] in items
+  ranges = {}
+  labels = {}
+  loops = [] # (label position, jump position) of backward jumps
+  for position, item in enumerate(items):
+    if item.__class__ is Label:
+      labels[item.name] = position
+    elif item.__class__ is Instruction:
+      for operand in item.operands:
+        kind = operand.kind
+        if (kind == OPERAND_REGISTER or kind == OPERAND_MEMORY) and operand.value.__class__ is int:
+          interval = ranges.get(operand.value)
+          if interval is None:
+            ranges[operand.value] = [position, position]
+          else:
+            interval[1] = position
+        elif kind == OPERAND_LABEL and operand.value in labels:
+          loops.append((labels[operand.value], position))
+  for start, end in loops: # values live into a loop stay live until its last jump back
+    for interval in ranges.values():
+      if interval[0] < start <= interval[1] < end:
+        interval[1] = end
+  return ranges
+
+class LinearScan:
+  def __init__(self):
+    self.spilled = 0 # virtual registers that went to the frame, over all functions
+    self.functions_spilling = 0
+
+  def assign(self, ranges, available): # virtual: physical register, and the spilled virtuals
+    order = sorted(ranges, key=lambda virtual: ranges[virtual][0])
+    free = list(range(available - 1, -1, -1)) # popped from the end, so the lowest register goes first
+    active = [] # (end, virtual), sorted by end
+    assigned = {}
+    spilled = []
+    for virtual in order:
+      start, end = ranges[virtual]
+      while active and active[0][0] <= start: # a value read for the last time where another is written can share its register
+        _, expired = active.pop(0)
+        free.append(assigned[expired])
+        free.sort(reverse=True)
+      if free:
+        assigned[virtual] = free.pop()
+        active.append((end, virtual))
+        active.sort()
+      else:
+        furthest_end, furthest = active[-1]
+        if furthest_end > end: # the value needed longest goes to memory
+          assigned[virtual] = assigned.pop(furthest)
+          spilled.append(furthest)
+          active[-1] = (end, virtual)
+          active.sort()
+        else:
+          spilled.append(virtual)
+    return assigned, spilled
+
+  def allocate(self, items, first_slot): # items with physical registers, and the number of frame slots used for spills
+    ranges = intervals(items)
+    assigned, spilled = self.assign(ranges, num_registers)
+    if not spilled:
+      registers, memory = operand_maps(assigned)
+      for item in items:
+        if item.__class__ is Instruction:
+          rename(item, registers, memory)
+      return items, 0
+    assigned, spilled = self.assign(ranges, num_registers - len(scratch))
+    self.spilled += len(spilled)
+    self.functions_spilling += 1
+    slots = {virtual: first_slot + index for index, virtual in enumerate(spilled)}
+    registers, memory = operand_maps(assigned)
+    out = []
+    for item in items:
+      if item.__class__ is not Instruction:
+        out.append(item)
+        continue
+      used = [] # spilled virtuals of this instruction, in operand order
+      read = set()
+      written = None
+      for position, operand in enumerate(item.operands):
+        kind = operand.kind
+        if (kind == OPERAND_REGISTER or kind == OPERAND_MEMORY) and operand.value in slots:
+          if operand.value not in used:
+            used.append(operand.value)
+          if kind == OPERAND_MEMORY or position > 0 or item.opcode not in overwriting_opcodes:
+            read.add(operand.value)
+          if kind == OPERAND_REGISTER and position == 0 and item.opcode in writing_opcodes:
+            written = operand.value
+      if not used:
+        rename(item, registers, memory)
+        out.append(item)
+        continue
+      for virtual, register in zip(used, scratch): # in scratch registers for this instruction only
+        registers[virtual] = reg(register)
+        memory[virtual] = mem(register)
+        if virtual in read:
+          out.extend(frame_slot(register, slots[virtual]))
+          out.append(Instruction("mov", (reg(register), mem(register))))
+      rename(item, registers, memory)
+      out.append(item)
+      if written is not None:
+        value = registers[written].value
+        address = scratch[1] if value == scratch[0] else scratch[0] # the other one was only an input
+        out.extend(frame_slot(address, slots[written]))
+        out.append(Instruction("mov", (mem(address), reg(value))))
+      for virtual in used:
+        del registers[virtual], memory[virtual]
+    return out, len(spilled)
+
+def frame_slot(register, slot): # register = the address of a frame slot, slots follow the locals below sf
+  return [Instruction("mov", (reg(register), SF)), Instruction("sub", (reg(register), imm(2 + slot * 2)))]
+
+def operand_maps(mapping): # virtual: physical as the operands to put in their place
+  return {virtual: reg(physical) for virtual, physical in mapping.items()}, {virtual: mem(physical) for virtual, physical in mapping.items()}
+
+def rename(instruction, registers, memory): # in place, the instructions are the function's own
+  renamed = []
+  changed = False
+  for operand in instruction.operands:
+    kind = operand.kind
+    if kind == OPERAND_REGISTER:
+      replacement = registers.get(operand.value)
+    elif kind == OPERAND_MEMORY:
+      replacement = memory.get(operand.value)
+    else:
+      replacement = None
+    if replacement is not None:
+      operand = replacement
+      changed = True
+    renamed.append(operand)
+  if changed:
+    instruction.operands = tuple(renamed)
@@ -0,0 +1,38 @@
+# symbol table with nested scopes, one for the globals and one more for each function and block open
+# every id maps to its innermost binding, which links to the one it shadows, so a lookup is a single dict access
+# however deep the scopes go, entering a scope is constant time and leaving one undoes just the bindings made in it
+
+class SymbolTable:
+  def __init__(self):
+    self.bindings = {} # id: (depth of its scope, symbol, binding it shadows or None)
+    self.scopes = [[]] # ids declared in each open scope, the globals first
+
+  @property
+  def depth(self): # 0 at the top level
+    return len(self.scopes) - 1
+
+  def enter(self):
+    self.scopes.append([])
+
+  def exit(self):
+    bindings = self.bindings
+    for key in self.scopes.pop():
+      shadowed = bindings[key][2]
+      if shadowed is None:
+        del bindings[key]
+      else:
+        bindings[key] = shadowed
+
+  def declare(self, key, symbol): # the symbol key had in the innermost scope, replaced by this one, None if it had none
+    depth = len(self.scopes) - 1
+    binding = self.bindings.get(key)
+    if binding is not None and binding[0] == depth:
+      self.bindings[key] = (depth, symbol, binding[2])
+      return binding[1]
+    self.bindings[key] = (depth, symbol, binding)
+    self.scopes[-1].append(key)
+    return None
+
+  def lookup(self, key): # symbol of the innermost declaration of key, None if it's not declared
+    binding = self.bindings.get(key)
+    return binding[1] if binding is not None else None
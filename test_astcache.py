@@ -0,0 +1,58 @@
+import os
+import pytest
+import astcache
+import astgen
+import lexer
+from defs import SourceFile
+
+text = "int g;\n\nint sum(int a, int b) {\n  int c = a + b;\n  return c * 2;\n}\n\nint main() {\n  g = 3;\n  return sum(g, 4);\n}\n"
+
+@pytest.fixture
+def stored(tmp_path): # a cache with the tree of text in it, and the entry's key
+  parser = astgen.AstGen("test.c", lexer.Lexer("test.c", text).lex())
+  parser.parse()
+  cache = astcache.AstCache(str(tmp_path / "cache"))
+  key = cache.key(text)
+  cache.store(key, parser.program.children)
+  return cache, key
+
+def load(cache, key):
+  return cache.load(key, SourceFile("test.c", text))
+
+def test_hit(stored):
+  cache, key = stored
+  declarations = load(cache, key)
+  assert [declaration.name for declaration in declarations] == ["g", "sum", "main"]
+
+def test_damaged_entries_miss(stored):
+  cache, key = stored
+  with open(cache.path(key), "rb") as f:
+    data = f.read()
+  for index in range(len(data)):
+    with open(cache.path(key), "wb") as f:
+      f.write(data[:index] + bytes([data[index] ^ 0xFF]) + data[index + 1:])
+    assert load(cache, key) is None, index
+
+@pytest.mark.parametrize("length", [0, 5, 20, 60, -1])
+def test_truncated_entries_miss(stored, length):
+  cache, key = stored
+  with open(cache.path(key), "rb") as f:
+    data = f.read()
+  with open(cache.path(key), "wb") as f:
+    f.write(data[:length])
+  assert load(cache, key) is None
+
+def test_unwritable_directory_skips_caching(tmp_path):
+  blocker = tmp_path / "file"
+  blocker.write_bytes(b"")
+  cache = astcache.AstCache(str(blocker / "cache")) # a directory can't be made under a file
+  cache.store(cache.key(text), [])
+  assert load(cache, cache.key(text)) is None
+
+def test_failed_store_leaves_no_temporary(stored, monkeypatch):
+  cache, key = stored
+  def replace(source, destination):
+    raise OSError("disk full")
+  monkeypatch.setattr(os, "replace", replace)
+  cache.store(cache.key(text + "\n"), [])
+  assert [name for name in os.listdir(cache.directory) if name.endswith(".tmp")] == []
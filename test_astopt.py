@@ -0,0 +1,43 @@
+import pytest
+import astgen
+import astopt
+import lexer
+from defs import AstNodeType
+
+def folded_expression(expression, iterative=False): # the folded right-hand side of an assignment, in a function with parameters x and y
+  text = f"int f(int x, int y) {{\n  x = {expression};\n  return x;\n}}\n"
+  parser = astgen.AstGen("test.c", lexer.Lexer("test.c", text).lex(), iterative=iterative)
+  parser.parse()
+  function = astopt.fold(parser.program).children[0]
+  return function.children[0].children[0].children[1]
+
+@pytest.mark.parametrize("iterative", [False, True])
+@pytest.mark.parametrize("expression, value", [
+  ("1 || 0 || 1", "1"),
+  ("0 || 0 || 0", "0"),
+  ("2 && 3 && 4", "1"),
+  ("1 && 0 && 1", "0"),
+  ("x + 0 + 1 || 2 && 3 && 4", "1"),
+  ("x || y || 1", "1"),
+  ("0 && x && y", "0"),
+])
+def test_constant_chains(expression, value, iterative):
+  node = folded_expression(expression, iterative)
+  assert node.type == AstNodeType.NUMBER_LITERAL
+  assert node.value == value
+
+def test_neutral_operands_dropped():
+  node = folded_expression("x || 0 || y || 0")
+  assert node.type == AstNodeType.OR
+  assert [child.type for child in node.children] == [AstNodeType.VALUE, AstNodeType.VALUE]
+
+def test_single_operand_stays_a_chain():
+  node = folded_expression("x && 1 && 2")
+  assert node.type == AstNodeType.AND
+  assert len(node.children) == 2
+  assert node.children[1].value == "1"
+
+def test_effects_before_deciding_operand_kept():
+  node = folded_expression("f(x) || 1 || y")
+  assert node.type == AstNodeType.OR
+  assert [child.type for child in node.children] == [AstNodeType.FUNCTION_CALL, AstNodeType.NUMBER_LITERAL]